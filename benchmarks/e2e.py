@@ -0,0 +1,320 @@
+"""Offline end-to-end benchmark, with a fake ngrok executable and an in-process CloudFront stub.
+
+Usage:
+    python benchmarks/e2e.py [--lines 200000] [--rotations 3] [--deploy-delay 1] [--output e2e.json]
+
+Each scenario runs ``ngrok.tunnel`` in a fresh interpreter, with ``benchmarks/fake_ngrok`` ahead in ``PATH`` and the
+shared CloudFront client replaced by ``StubCloudFront``, which simulates the API latency and the deployment delay.
+
+Reports the time to the first public URL, the time from each URL to the update and from the update to the
+deployment, the lines per second through ``ngrok.writer`` and the peak RSS.
+Results are stored as JSON to track regressions.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_NGROK = os.path.join(ROOT, "benchmarks", "fake_ngrok")
+DISTRIBUTION_ID = "EBENCHMARK"
+SCENARIOS = {
+    "stdout-text": dict(log="stdout"),
+    "file-text": dict(log="file"),
+    "file-json": dict(log="file", log_format="json"),
+    "file-queue": dict(log="file", log_queue=True),
+    "file-rotate": dict(log="file", log_max_bytes=1_000_000),
+}
+CONFIG = {
+    "CallerReference": "benchmark",
+    "Comment": "",
+    "Enabled": True,
+    "Origins": {
+        "Quantity": 1,
+        "Items": [
+            {
+                "Id": "origin.ngrok-free.app",
+                "DomainName": "origin.ngrok-free.app",
+                "CustomOriginConfig": {
+                    "HTTPPort": 80,
+                    "HTTPSPort": 443,
+                    "OriginProtocolPolicy": "https-only",
+                },
+            }
+        ],
+    },
+    "DefaultCacheBehavior": {
+        "TargetOriginId": "origin.ngrok-free.app",
+        "ViewerProtocolPolicy": "redirect-to-https",
+    },
+    "CacheBehaviors": {
+        "Quantity": 100,
+        "Items": [
+            {
+                "PathPattern": f"/static/{index}/*",
+                "TargetOriginId": "origin.ngrok-free.app",
+                "ViewerProtocolPolicy": "redirect-to-https",
+            }
+            for index in range(100)
+        ],
+    },
+}
+
+
+class StubCloudFront:
+    """Stand-in for the boto3 CloudFront client, with simulated latency and deployment delay.
+
+    >>> StubCloudFront
+
+    """
+
+    def __init__(self, latency: float, deploy_delay: float):
+        """Instantiates the stub.
+
+        Args:
+            latency: Seconds added to every API call.
+            deploy_delay: Seconds for an update to reach the ``Deployed`` status.
+        """
+        self.latency = latency
+        self.deploy_delay = deploy_delay
+        self.config = copy.deepcopy(CONFIG)
+        self.etag = 1
+        self.deployed_at = 0.0
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str) -> None:
+        """Counts the call and simulates the round trip."""
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        time.sleep(self.latency)
+
+    def _response(self, distribution_id: str) -> Dict[str, Any]:
+        """Builds a response in the shape returned by boto3."""
+        status = "Deployed" if time.monotonic() >= self.deployed_at else "InProgress"
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "ETag": f"E{self.etag}",
+            "Distribution": {
+                "Id": distribution_id,
+                "Status": status,
+                "DistributionConfig": copy.deepcopy(self.config),
+            },
+        }
+
+    def get_distribution(self, Id: str) -> Dict[str, Any]:  # noqa: N803
+        """Returns the current config and status."""
+        self._call("get_distribution")
+        with self._lock:
+            return self._response(Id)
+
+    def update_distribution(
+        self, DistributionConfig: Dict[str, Any], Id: str, IfMatch: str  # noqa: N803
+    ) -> Dict[str, Any]:
+        """Applies the config, and starts the simulated deployment."""
+        from botocore.exceptions import ClientError
+
+        self._call("update_distribution")
+        with self._lock:
+            if IfMatch != f"E{self.etag}":
+                raise ClientError(
+                    {"Error": {"Code": "PreconditionFailed", "Message": IfMatch}},
+                    "UpdateDistribution",
+                )
+            self.config = copy.deepcopy(DistributionConfig)
+            self.etag += 1
+            self.deployed_at = time.monotonic() + self.deploy_delay
+            response = self._response(Id)
+            response["Distribution"]["Status"] = "InProgress"
+            return response
+
+
+def summary(values: List[float]) -> Dict[str, float] | None:
+    """Summarizes a list of durations."""
+    if not values:
+        return
+    return {
+        "count": len(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def child(scenario: str, latency: float, deploy_delay: float) -> None:
+    """Runs a single scenario in the current interpreter, and prints the result as JSON."""
+    from nctl import aws, metrics, models, ngrok
+
+    stub = StubCloudFront(latency=latency, deploy_delay=deploy_delay)
+    aws._create_client = lambda: stub
+    writer, window = ngrok.writer, []
+
+    def timed_writer(frame) -> None:
+        # keeps the time of the first and the latest line
+        window[1:] = [time.perf_counter()]
+        writer(frame)
+
+    def settle() -> None:
+        # nctl buffers ngrok's output, so the tunnel is stopped once the last public URL is deployed, not when
+        # ngrok has written the last line
+        rotations = int(os.environ.get("FAKE_NGROK_ROTATIONS", 0))
+        while True:
+            time.sleep(0.05)
+            if (
+                metrics.PUBLIC_URL_CHANGES.value(tunnel="command_line") or 0
+            ) <= rotations:
+                continue
+            worker = models.concurrency.workers.get("command_line")
+            history = worker.history() if worker else []
+            if (
+                history
+                and history[-1].public_url
+                == models.concurrency.public_urls.get("command_line")
+                and history[-1].deployed is not None
+            ):
+                models.concurrency.supervisor.request_stop()
+                return
+
+    ngrok.writer = timed_writer
+    threading.Thread(target=settle, name="settle", daemon=True).start()
+    start = time.perf_counter()
+    ngrok.tunnel(
+        port=8080,
+        distribution_id=DISTRIBUTION_ID,
+        aws_default_region="us-east-1",
+        ngrok_auth="benchmark",
+        url_debounce=0,
+        deploy_initial_delay=0.05,
+        deploy_max_delay=0.5,
+        **SCENARIOS[scenario],
+    )
+    elapsed = time.perf_counter() - start
+    lines = sum(
+        metrics.NGROK_LINES.value(lvl=lvl) or 0
+        for lvl in ("info", "dbug", "warn", "error", "")
+    )
+    jobs = [
+        job
+        for worker in models.concurrency.workers.values()
+        for job in worker.history()
+    ]
+    result = {
+        "scenario": scenario,
+        "elapsed": elapsed,
+        "lines": lines,
+        "lines_per_sec": lines / (window[-1] - window[0]) if len(window) == 2 else None,
+        "first_url": metrics.PUBLIC_URL_SECONDS.value(tunnel="command_line"),
+        "url_to_update": summary(
+            [
+                job.wait + job.duration
+                for job in jobs
+                if not (job.error or job.cancelled)
+            ]
+        ),
+        "update_to_deployed": summary([job.deployed for job in jobs if job.deployed]),
+        "url_changes": metrics.PUBLIC_URL_CHANGES.value(tunnel="command_line"),
+        "api_calls": stub.calls,
+        # kilobytes on Linux, bytes on macOS
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    print(json.dumps(result))
+
+
+def run(args: argparse.Namespace) -> None:
+    """Runs every scenario in a fresh interpreter and working directory, and stores the results."""
+    env = dict(
+        os.environ,
+        PATH=os.pathsep.join((FAKE_NGROK, os.environ.get("PATH", ""))),
+        PYTHONPATH=os.pathsep.join((ROOT, os.environ.get("PYTHONPATH", ""))),
+        FAKE_NGROK_LINES=str(args.lines),
+        FAKE_NGROK_ROTATIONS=str(args.rotations),
+        FAKE_NGROK_RATE=str(args.rate),
+        # upper bound, the scenario stops as soon as the last deployment completes
+        FAKE_NGROK_HOLD=str(args.timeout),
+    )
+    results = []
+    for scenario in args.scenarios:
+        with tempfile.TemporaryDirectory() as workdir:
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--child",
+                    scenario,
+                    "--latency",
+                    str(args.latency),
+                    "--deploy-delay",
+                    str(args.deploy_delay),
+                ],
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                check=True,
+            )
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"{scenario:<12} first URL: {result['first_url'] or 0:.3f}s  "
+            f"URL to update: {(result['url_to_update'] or {}).get('median', 0):.3f}s  "
+            f"update to deployed: {(result['update_to_deployed'] or {}).get('median', 0):.3f}s  "
+            f"writer: {result['lines_per_sec'] or 0:,.0f} lines/sec  "
+            f"peak RSS: {result['peak_rss']:,}"
+        )
+    report = {
+        "timestamp": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "lines": args.lines,
+            "rotations": args.rotations,
+            "rate": args.rate,
+            "latency": args.latency,
+            "deploy_delay": args.deploy_delay,
+            "timeout": args.timeout,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results stored in {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--rotations", type=int, default=3)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Lines per second, 0 for unthrottled."
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per API call."
+    )
+    parser.add_argument("--deploy-delay", type=float, default=1)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the last deployment.",
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--output", default="e2e.json")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child:
+        child(arguments.child, arguments.latency, arguments.deploy_delay)
+    else:
+        run(arguments)
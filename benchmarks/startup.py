@@ -0,0 +1,90 @@
+"""Startup benchmark that guards the CLI path against heavy imports.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--budget-ms 100]
+
+Exits with a non-zero status code when ``import nctl`` exceeds the budget or loads any of the heavy modules.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+HEAVY = ("boto3", "botocore", "pydantic", "pydantic_settings", "yaml")
+VERSION = (
+    "import sys; sys.argv = ['nctl', '--version']; import nctl; nctl.commandline()"
+)
+
+
+def importtime() -> tuple[float, set]:
+    """Imports nctl in a fresh interpreter with ``-X importtime``
+
+    Returns:
+        tuple[float, set]:
+        Cumulative import time of nctl in milliseconds, and the names of all the modules imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import nctl"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative, modules = 0.0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        if not total.strip().isdigit():
+            continue
+        name = name.strip()
+        modules.add(name)
+        if name == "nctl":
+            cumulative = int(total) / 1000
+    return cumulative, modules
+
+
+def version() -> float:
+    """Times ``nctl --version`` end-to-end, including the interpreter startup.
+
+    Returns:
+        float:
+        Wall time in milliseconds.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", VERSION], capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(runs: int, budget: float) -> int:
+    """Runs the benchmark and returns the exit code."""
+    samples = [importtime() for _ in range(runs)]
+    best = min(cumulative for cumulative, _ in samples)
+    heavy = sorted(
+        {
+            module
+            for _, modules in samples
+            for module in modules
+            if module.split(".")[0] in HEAVY
+        }
+    )
+    cli = min(version() for _ in range(runs))
+    print(f"import nctl     : {best:.1f} ms (best of {runs})")
+    print(
+        f"nctl --version  : {cli:.1f} ms (best of {runs}, including interpreter startup)"
+    )
+    if heavy:
+        print(f"heavy imports   : {', '.join(heavy)}")
+        return 1
+    if best > budget:
+        print(f"import nctl exceeds the budget of {budget} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=100)
+    args = parser.parse_args()
+    sys.exit(run(args.runs, args.budget_ms))
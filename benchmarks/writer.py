@@ -0,0 +1,81 @@
+"""Micro-benchmark comparing the legacy string-splitting writer against the logfmt tokenizer.
+
+Usage:
+    python benchmarks/writer.py [--lines 200000]
+"""
+
+import argparse
+import logging
+import time
+
+from nctl import logfmt, models, ngrok
+
+SAMPLE = (
+    b't=2024-08-17T10:00:00-0500 lvl=info msg="join connections" obj=join id=7c5b2c9e4a1d '
+    b"l=127.0.0.1:8080 r=203.0.113.7:51234\n"
+    b't=2024-08-17T10:00:00-0500 lvl=dbug msg="decoded StartStream" obj=tunnels.session '
+    b"stream=2 clientid=abcdef\n"
+    b't=2024-08-17T10:00:00-0500 lvl=warn msg="failed to check for update" obj=updater '
+    b'err="Post \\"https://update.equinox.io/check\\": context deadline exceeded"\n'
+)
+
+
+def legacy_writer(frame: str) -> None:
+    """Copy of the string-splitting writer prior to the logfmt tokenizer."""
+    try:
+        level = frame.split("lvl=")[1].split()[0]
+    except IndexError:
+        return
+    if level == "info":
+        log = ngrok.LOGGER.info
+    elif level == "warn":
+        log = ngrok.LOGGER.warning
+    elif level in ("err", "error"):
+        log = ngrok.LOGGER.error
+    else:
+        return
+    msg = frame.split("msg=")[-1].replace('"', "").replace("'", "")
+    if "url=" in msg and not models.concurrency.public_urls:
+        msg.split("url=")[-1].strip()
+    log(msg)
+
+
+class RenderHandler(logging.Handler):
+    """Handler that renders the message of every record without writing it anywhere."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Renders the message, as any handler with a formatter would."""
+        record.getMessage()
+
+
+def run(lines: int) -> None:
+    """Runs both writers against the same stream and prints lines per second."""
+    # INFO is the default level, so records are rendered as in production, but aren't written to avoid measuring I/O
+    ngrok.LOGGER.setLevel(logging.INFO)
+    ngrok.LOGGER.addHandler(RenderHandler())
+    ngrok.LOGGER.propagate = False
+    sample_lines = SAMPLE.splitlines(keepends=True)
+    stream = b"".join(sample_lines[i % len(sample_lines)] for i in range(lines))
+
+    start = time.perf_counter()
+    for line in stream.splitlines():
+        legacy_writer(line.decode().strip())
+    legacy = lines / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tokenizer = logfmt.Tokenizer(lazy=True)
+    # feed in pipe-sized chunks to include the cost of re-assembling partial lines
+    for offset in range(0, len(stream), 65536):
+        end = offset + 65536
+        for frame in tokenizer.feed(stream[offset:end]):
+            ngrok.writer(frame)
+    current = lines / (time.perf_counter() - start)
+
+    print(f"legacy writer  : {legacy:,.0f} lines/sec")
+    print(f"logfmt writer  : {current:,.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200_000)
+    run(parser.parse_args().lines)
@@ -4,11 +4,18 @@ import sys
 
 import click
 
-from nctl.ngrok import tunnel  # noqa: F401
-
 version = "0.0.1"
 
 
+def __getattr__(name: str):
+    """Loads the tunnel lazily, so that ``--version`` and ``--help`` don't import boto3 and pydantic."""
+    if name == "tunnel":
+        from nctl.ngrok import tunnel
+
+        return tunnel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 @click.command()
 @click.argument("start", required=False)
 @click.argument("run", required=False)
@@ -20,6 +27,17 @@ version = "0.0.1"
     type=click.Path(exists=True),
     help="Environment configuration filepath.",
 )
+@click.option("--to", "-T", help="Snapshot ID to roll back to.")
+@click.option("--url", "-U", help="Public URL to plan the changes for.")
+@click.option(
+    "--profile", "-P", is_flag=True, help="Profiles the CPU usage with cProfile."
+)
+@click.option(
+    "--trace-memory",
+    "-M",
+    is_flag=True,
+    help="Traces memory allocations with tracemalloc.",
+)
 def commandline(*args, **kwargs) -> None:
     """Starter function to invoke nctl via CLI commands.
 
@@ -27,16 +45,28 @@ def commandline(*args, **kwargs) -> None:
         - ``--version | -V``: Prints the version.
         - ``--help | -H``: Prints the help section.
         - ``--env | -E``: Environment configuration filepath.
+        - ``--to | -T``: Snapshot ID to roll back to.
+        - ``--url | -U``: Public URL to plan the changes for.
+        - ``--profile | -P``: Profiles the CPU usage with cProfile.
+        - ``--trace-memory | -M``: Traces memory allocations with tracemalloc.
 
     **Commands**
         ``start | run``: Initiates the backup process.
+        ``rollback``: Restores the origin from a stored snapshot.
+        ``plan``: Prints the changes for a public URL, without updating the distribution.
     """
     assert sys.argv[0].lower().endswith("nctl"), "Invalid commandline trigger!!"
     options = {
         "--version | -V": "Prints the version.",
         "--help | -H": "Prints the help section.",
         "--env | -E": "Environment configuration filepath.",
+        "--to | -T": "Snapshot ID to roll back to.",
+        "--url | -U": "Public URL to plan the changes for.",
+        "--profile | -P": "Profiles the CPU usage with cProfile.",
+        "--trace-memory | -M": "Traces memory allocations with tracemalloc.",
         "start | run": "Initiates the backup process.",
+        "rollback": "Restores the origin from a stored snapshot.",
+        "plan": "Prints the changes for a public URL, without updating.",
     }
     # weird way to increase spacing to keep all values monotonic
     _longest_key = len(max(options.keys()))
@@ -54,10 +84,23 @@ def commandline(*args, **kwargs) -> None:
         )
         sys.exit(0)
     trigger = kwargs.get("start") or kwargs.get("run")
+    # flags are only forwarded when set, so that they don't override the env file
+    env = {key: True for key in ("profile", "trace_memory") if kwargs.get(key)}
+    env["env_file"] = kwargs.get("env")
     if trigger and trigger.lower() in ("start", "run"):
+        from nctl.ngrok import tunnel
+
         # Click doesn't support assigning defaults like traditional dictionaries, so kwargs.get("max", 100) won't work
-        tunnel(env_file=kwargs.get("env"))
+        tunnel(**env)
         sys.exit(0)
+    elif trigger and trigger.lower() == "rollback":
+        from nctl.commands import rollback
+
+        sys.exit(0 if rollback(to=kwargs.get("to"), **env) else 1)
+    elif trigger and trigger.lower() == "plan":
+        from nctl.commands import plan
+
+        sys.exit(0 if plan(url=kwargs.get("url"), **env) else 1)
     elif trigger:
         click.secho(f"\n{trigger!r} - Invalid command", fg="red")
     else:
@@ -0,0 +1,163 @@
+import http.client
+import json
+import logging
+import threading
+import time
+from typing import Iterator
+from urllib.parse import urlparse
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+
+class AgentClient:
+    """Keep-alive HTTP client for ngrok's local agent API.
+
+    >>> AgentClient
+
+    See Also:
+        - A single connection is reused across polls, and re-established only when it breaks.
+        - https://ngrok.com/docs/agent/api/#list-tunnels
+    """
+
+    def __init__(self, base_url: str, timeout: float = 1):
+        """Instantiates the client without connecting.
+
+        Args:
+            base_url: Base URL of the agent API, eg: ``http://127.0.0.1:4040``
+            timeout: Socket timeout for each request.
+        """
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 4040
+        self.timeout = timeout
+        self._connection: http.client.HTTPConnection | None = None
+
+    def _request(self, path: str) -> dict:
+        """Makes a GET request on the pooled connection and returns the decoded JSON.
+
+        Args:
+            path: Path of the API endpoint.
+
+        Returns:
+            dict:
+            Decoded JSON response.
+        """
+        if not self._connection:
+            self._connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        try:
+            self._connection.request(
+                "GET", path, headers={"Accept": "application/json"}
+            )
+            response = self._connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.status != 200:
+            raise http.client.HTTPException(f"{path} returned {response.status}")
+        return json.loads(body)
+
+    def tunnels(self) -> list:
+        """Lists the tunnels currently running on the agent.
+
+        Returns:
+            list:
+            List of tunnel objects.
+        """
+        return self._request("/api/tunnels").get("tunnels", [])
+
+    def public_url(self, name: str | None = None) -> str | None:
+        """Gets the public URL of the first HTTPS tunnel, optionally filtered by the tunnel name.
+
+        Args:
+            name: Name of the tunnel.
+
+        Returns:
+            str:
+            Public URL if the tunnel is up, otherwise ``None``.
+        """
+        for tunnel in self.tunnels():
+            if name and tunnel.get("name") != name:
+                continue
+            if (public_url := tunnel.get("public_url", "")).startswith("https://"):
+                return public_url
+
+    def close(self) -> None:
+        """Closes the underlying connection."""
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+def discover(
+    client: AgentClient,
+    interval: float,
+    max_interval: float,
+    factor: float,
+    timeout: float,
+    stop: threading.Event | None = None,
+    name: str | None = None,
+) -> str | None:
+    """Polls the agent API with exponential backoff until the public URL is available.
+
+    Args:
+        client: Agent API client.
+        interval: Initial interval between polls.
+        max_interval: Maximum interval between polls.
+        factor: Multiplier applied to the interval after each unsuccessful poll.
+        timeout: Maximum time to wait for the public URL.
+        stop: Event to abort polling.
+        name: Name of the tunnel.
+
+    Returns:
+        str:
+        Public URL of the tunnel, or ``None`` if it wasn't available within the timeout.
+    """
+    stop = stop or threading.Event()
+    deadline = time.monotonic() + timeout
+    while not stop.is_set():
+        try:
+            if public_url := client.public_url(name):
+                return public_url
+        except (OSError, http.client.HTTPException, ValueError) as error:
+            # the agent API won't be listening until ngrok has started
+            LOGGER.debug("Agent API unavailable: %s", error)
+        if (remaining := deadline - time.monotonic()) <= 0:
+            LOGGER.error("Public URL was not available within %ss", timeout)
+            return
+        stop.wait(min(interval, remaining))
+        interval = min(interval * factor, max_interval)
+
+
+def watch(
+    client: AgentClient,
+    public_url: str,
+    interval: float,
+    stop: threading.Event,
+    name: str | None = None,
+) -> Iterator[str]:
+    """Polls the agent API at a fixed interval, and yields the public URL whenever it changes.
+
+    Args:
+        client: Agent API client.
+        public_url: Public URL that was discovered last.
+        interval: Interval between polls.
+        stop: Event to stop polling.
+        name: Name of the tunnel.
+
+    Yields:
+        str:
+        New public URL of the tunnel.
+    """
+    while not stop.wait(interval):
+        try:
+            current = client.public_url(name)
+        except (OSError, http.client.HTTPException, ValueError) as error:
+            # the agent API is briefly unavailable while ngrok reconnects
+            LOGGER.debug("Agent API unavailable: %s", error)
+            continue
+        if current and current != public_url:
+            public_url = current
+            yield public_url
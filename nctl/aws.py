@@ -1,18 +1,172 @@
+import copy
+import functools
 import json
 import logging
 import os
-from datetime import datetime
-from typing import Any, Dict
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
 
-import boto3
-import yaml
-from botocore.exceptions import ClientError, WaiterError
-from pydantic import ValidationError
+from botocore.exceptions import ClientError
+from pydantic import BaseModel, ValidationError
 from pydantic_core import InitErrorDetails
 
-from nctl import logger, models
+from nctl import diff, metrics, models
+from nctl.cache import DistributionCache, ParseCache
+from nctl.snapshots import Snapshot, SnapshotStore
+from nctl.throttle import TokenBucket
+from nctl.waiter import DeployWaiter
 
 LOGGER = logging.getLogger("nctl.cloudfront")
+_CLIENT_LOCK = threading.Lock()
+_REFRESHER: "CredentialRefresher | None" = None
+_RETRYABLE = ("Throttling", "PreconditionFailed")
+
+
+def error_code(error: ClientError) -> str | None:
+    """Extracts the error code from a ``ClientError``.
+
+    Args:
+        error: Error raised by botocore.
+
+    Returns:
+        str:
+        Error code, eg: ``PreconditionFailed``
+    """
+    if isinstance(error.response, dict):
+        return error.response.get("Error", {}).get("Code")
+
+
+class CredentialRefresher(threading.Thread):
+    """Refreshes temporary credentials in the background, ahead of their expiry.
+
+    >>> CredentialRefresher
+
+    See Also:
+        - botocore refreshes expiring credentials on the thread that signs the next request, so an update would
+          wait for the STS or IMDS call. This thread triggers the refresh within botocore's advisory window instead.
+        - Static credentials never need a refresh, so the thread is only started for refreshable ones.
+    """
+
+    def __init__(self, credentials: Any, interval: float = 60):
+        """Instantiates the refresher.
+
+        Args:
+            credentials: Refreshable credentials from botocore.
+            interval: Seconds between the expiry checks.
+        """
+        super().__init__(name="credential-refresher", daemon=True)
+        self.credentials = credentials
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """Checks the expiry until stopped."""
+        while not self._stopping.wait(self.interval):
+            if not self.credentials.refresh_needed():
+                continue
+            try:
+                self.credentials.get_frozen_credentials()
+            except Exception as error:
+                # botocore retries on the next request, so the refresh is not fatal
+                LOGGER.warning("Failed to refresh AWS credentials: %s", error)
+            else:
+                LOGGER.debug("AWS credentials have been refreshed")
+
+    def stop(self) -> None:
+        """Stops checking, without waiting for an in-flight refresh."""
+        self._stopping.set()
+
+
+@functools.cache
+def _loader() -> Any:
+    """Creates the botocore data loader once, so the service model and endpoints are parsed once per process."""
+    from botocore.loaders import create_loader
+
+    return create_loader()
+
+
+def _create_session() -> Any:
+    """Creates a boto3 session with the shared loader, and the credential cache of the assume-role providers."""
+    import boto3
+    import botocore.session
+
+    core = botocore.session.get_session()
+    core.register_component("data_loader", _loader())
+    session = boto3.Session(
+        aws_access_key_id=models.env.aws_access_key_id,
+        aws_secret_access_key=models.env.aws_secret_access_key,
+        region_name=models.env.aws_default_region,
+        profile_name=models.env.aws_profile_name,
+        botocore_session=core,
+    )
+    # boto3 appends its data path to the loader on every session
+    search_paths = _loader().search_paths
+    search_paths[:] = dict.fromkeys(search_paths)
+    if models.env.aws_credential_cache and not models.env.aws_access_key_id:
+        from botocore.utils import JSONFileCache
+
+        directory = os.path.expanduser(models.env.aws_credential_cache)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        cache = JSONFileCache(working_dir=directory)
+        # assume-role, web identity and SSO credentials are reused across processes until they expire
+        for provider in core.get_component("credential_provider").providers:
+            if hasattr(provider, "cache"):
+                provider.cache = cache
+    return session
+
+
+@functools.cache
+def _create_client() -> Any:
+    """Creates a CloudFront client sized to the maximum number of parallel updates, and resolves the credentials."""
+    global _REFRESHER
+    # boto3 takes a few hundred milliseconds to import, so it is loaded only when a client is required
+    from botocore.config import Config
+
+    session = _create_session()
+    client = session.client(
+        "cloudfront",
+        config=Config(max_pool_connections=max(10, models.env.max_parallel)),
+    )
+    # assume-role credentials are deferred until the first request, which would otherwise pay for the STS call
+    if credentials := session.get_credentials():
+        start = time.perf_counter()
+        credentials.get_frozen_credentials()
+        LOGGER.debug(
+            "AWS credentials resolved with %s in %.3fs",
+            credentials.method,
+            time.perf_counter() - start,
+        )
+        if hasattr(credentials, "refresh_needed"):
+            _REFRESHER = CredentialRefresher(credentials)
+            _REFRESHER.start()
+    return client
+
+
+def shared_client() -> Any:
+    """Returns the CloudFront client shared across all the distributions.
+
+    See Also:
+        boto3 clients are thread-safe, so the session, credentials and connection pool are resolved only once.
+
+    Returns:
+        Any:
+        CloudFront client.
+    """
+    with _CLIENT_LOCK:
+        return _create_client()
+
+
+def reset_client() -> None:
+    """Discards the shared client, so that the next one is created with the current credentials."""
+    global _REFRESHER
+    with _CLIENT_LOCK:
+        if _REFRESHER:
+            _REFRESHER.stop()
+            _REFRESHER = None
+        _create_client.cache_clear()
 
 
 class CloudFront:
@@ -22,50 +176,178 @@ class CloudFront:
 
     """
 
-    def __init__(self, env_dump: Dict[str, Any]):
-        """Initiates the boto3 client and re-configures the environment variables.
+    def __init__(self, tunnel: models.Tunnel | None = None, client: Any = None):
+        """Instantiates the object for a tunnel's distribution.
 
         Args:
-            env_dump: JSON dump of environment variables' configuration.
-        """
-        models.env = models.EnvConfig(**env_dump)
-        logger.configure_logging(
-            debug=models.env.debug,
-            process="cloudfront",
-            log_config=models.env.log_config,
-            log=models.env.log,
-        )
-        session = boto3.Session(
-            aws_access_key_id=models.env.aws_access_key_id,
-            aws_secret_access_key=models.env.aws_secret_access_key,
-            region_name=models.env.aws_default_region,
-            profile_name=models.env.aws_profile_name,
-        )
-        self.client = session.client("cloudfront")
+            tunnel: Tunnel to distribution mapping. Defaults to the first mapping in the environment config.
+            client: CloudFront client, defaults to the shared client.
+        """
+        self.tunnel = tunnel or models.env.mappings()[0]
+        self.distribution_id = self.tunnel.distribution_id
+        self.client = client or shared_client()
+        self.cancel = threading.Event()
+        self.deployment: Future | None = None
+        self.last_response: Dict[str, Any] | None = None
 
-    def run(self, public_url: str) -> None:
+    @metrics.timed("run")
+    def run(self, public_url: str, cancel: threading.Event | None = None) -> None:
         """Updates the distribution if ID is available, otherwise creates a new distribution.
 
         Args:
             public_url: Public URL from ngrok, that has to be updated.
+            cancel: Event that is set when this update has been superseded by a newer public URL.
         """
-        origin = public_url.lstrip("https://")
-        if models.env.distribution_id:
-            LOGGER.info(
-                "Updating existing distribution: %s", models.env.distribution_id
-            )
+        self.cancel = cancel or threading.Event()
+        self.deployment = None
+        origin = public_url.removeprefix("https://")
+        if self.distribution_id:
+            LOGGER.info("Updating existing distribution: %s", self.distribution_id)
         else:
             # First create a skeleton distribution using the provided config file
             # Then pull what's on AWS CloudFront to update distribution to retain consistency
             LOGGER.info(
                 "Creating new distribution with config file: %s",
-                models.env.distribution_config,
+                self.tunnel.distribution_config,
             )
             self.create_distribution()
-        self.update_distribution(
-            current_config=self.get_distribution(), origin_name=origin
+        self.apply_origin(origin)
+        if self.tunnel.distribution_ids and not self.cancel.is_set():
+            LOGGER.info(
+                "Updating %d distributions that share the origin",
+                len(self.tunnel.distribution_ids),
+            )
+            bulk_update(self.tunnel.distribution_ids, public_url)
+
+    def apply_origin(
+        self, origin: str, snapshot: Dict[str, Any] | None = None
+    ) -> List[diff.Change]:
+        """Points the distribution to the origin, with a single request when the cached config is current.
+
+        Args:
+            origin: Origin name that has to be replaced with.
+            snapshot: Distribution config from a snapshot, to restore the origins from instead.
+
+        Returns:
+            List[diff.Change]:
+            List of changes that were applied.
+        """
+        # the cached config avoids a GET request, and a stale ETag is rejected by CloudFront
+        if cached := self.cache.load():
+            LOGGER.debug("Using cached distribution config: %s", self.cache.filepath)
+            current_config = cached
+            # the cache can't tell that nothing has to change, since the live config may have been changed elsewhere
+            if not self.changes(cached, origin, snapshot):
+                LOGGER.debug("Cached config is up to date, verifying the live config")
+                cached = None
+                current_config = self.get_distribution()
+        else:
+            current_config = self.get_distribution()
+        if self.cancel.is_set():
+            LOGGER.info("Update for %s has been superseded", origin)
+            return []
+        try:
+            return self.update_distribution(
+                current_config=current_config, origin_name=origin, snapshot=snapshot
+            )
+        except ClientError as error:
+            if not cached or error_code(error) != "PreconditionFailed":
+                raise
+            LOGGER.info("Cached ETag is outdated, retrying with the latest config")
+            metrics.CLOUDFRONT_RETRIES.inc(reason="PreconditionFailed")
+            return self.update_distribution(
+                current_config=self.get_distribution(),
+                origin_name=origin,
+                snapshot=snapshot,
+            )
+
+    @metrics.timed("plan")
+    def plan(self, origin: str) -> List[diff.Change]:
+        """Computes the changes required to point the distribution to the origin, without updating it.
+
+        Args:
+            origin: Origin name that has to be replaced with.
+
+        Returns:
+            List[diff.Change]:
+            List of changes that an update would apply.
+        """
+        if cached := self.cache.load():
+            LOGGER.debug("Using cached distribution config: %s", self.cache.filepath)
+            if changes := self.changes(cached, origin):
+                return changes
+        # an empty diff is only trusted from the live config
+        return self.changes(self.get_distribution(), origin)
+
+    def changes(
+        self,
+        current_config: Dict[str, Any],
+        origin_name: str,
+        snapshot: Dict[str, Any] | None = None,
+    ) -> List[diff.Change]:
+        """Computes the changes to the current config, to point it to the origin or restore it from a snapshot.
+
+        Args:
+            current_config: Current configuration as in CloudFront, or as cached.
+            origin_name: Origin name that has to be replaced with.
+            snapshot: Distribution config from a snapshot, to restore the origins from instead.
+
+        Returns:
+            List[diff.Change]:
+            List of changes that an update would apply.
+        """
+        distribution_config = current_config["Distribution"]["DistributionConfig"]
+        return diff.diff(
+            distribution_config,
+            self.desired_config(distribution_config, origin_name, snapshot),
+        )
+
+    def desired_config(
+        self,
+        distribution_config: Dict[str, Any],
+        origin_name: str,
+        snapshot: Dict[str, Any] | None = None,
+    ) -> Dict[str, Any]:
+        """Creates the config to update to, either from the origin or from a snapshot."""
+        if snapshot:
+            return self.restore_config(distribution_config, snapshot)
+        return self.origin_config(distribution_config, origin_name)
+
+    @metrics.timed("rollback")
+    def rollback(self, snapshot_id: str | None = None) -> List[diff.Change]:
+        """Restores the origin of the distribution from a snapshot.
+
+        See Also:
+            Only the origin is restored, the rest of the config is left as is.
+
+        Args:
+            snapshot_id: Full or abbreviated snapshot ID. Defaults to the snapshot before the latest one.
+
+        Returns:
+            List[diff.Change]:
+            List of changes that were applied.
+        """
+        self.deployment = None
+        if snapshot_id:
+            snapshot = self.snapshots.resolve(snapshot_id)
+        elif len(snapshots := self.snapshots.list()) >= 2:
+            snapshot = snapshots[-2]
+        else:
+            raise KeyError(
+                f"No previous snapshot to roll back to for {self.distribution_id!r}"
+            )
+        config = self.snapshots.load(snapshot.id)
+        origin = config["DefaultCacheBehavior"]["TargetOriginId"]
+        LOGGER.info(
+            "Rolling back %s to %s from snapshot %s [%s]",
+            self.distribution_id,
+            origin,
+            snapshot.id[:12],
+            snapshot.created,
         )
+        return self.apply_origin(origin, snapshot=config)
 
+    @metrics.timed("get_distribution")
     def get_distribution(self) -> dict:
         """Get cloudfront distribution.
 
@@ -73,17 +355,22 @@ class CloudFront:
             dict:
             Distribution information.
         """
-        LOGGER.info("Getting distribution info for: %s", models.env.distribution_id)
-        return self.client.get_distribution(Id=models.env.distribution_id)
+        LOGGER.info("Getting distribution info for: %s", self.distribution_id)
+        response = self.client.get_distribution(Id=self.distribution_id)
+        self.cache.save(response)
+        self.last_response = response
+        return response
 
+    @metrics.timed("create_distribution")
     def create_distribution(self) -> None:
         """Creates a cloudfront distribution from a JSON or YAML file as config."""
-        sfx = models.env.distribution_config.suffix.lower()
+        sfx = self.tunnel.distribution_config.suffix.lower()
         if sfx in (".yml", ".yaml"):
-            with open(models.env.distribution_config) as file:
-                config = yaml.load(file, Loader=yaml.FullLoader)
+            config = ParseCache(models.env.configdir).load(
+                self.tunnel.distribution_config
+            )
         elif sfx == ".json":
-            with open(models.env.distribution_config) as file:
+            with open(self.tunnel.distribution_config) as file:
                 config = json.load(file)
         else:
             # This shouldn't happen programmatically, but just in case
@@ -105,42 +392,58 @@ class CloudFront:
                 "CloudFront distribution has been created. Deployment status: %s",
                 create_response["Distribution"]["Status"],
             )
-            models.env.distribution_id = create_response["Distribution"]["Id"]
-            LOGGER.info("Distribution Id: %s", models.env.distribution_id)
+            self.distribution_id = create_response["Distribution"]["Id"]
+            LOGGER.info("Distribution Id: %s", self.distribution_id)
         else:
             raise ClientError(
                 operation_name="CreateDistribution",
                 error_response=create_response.get("ResponseMetadata"),
             )
 
-    def update_distribution(
-        self, current_config: Dict[str, Any], origin_name: str
-    ) -> None:
-        """Updates the origin host of a cloudfront distribution.
+    @property
+    def cache(self) -> DistributionCache:
+        """Local cache of the distribution config and ETag.
+
+        Returns:
+            DistributionCache:
+            Cache object for the current distribution ID.
+        """
+        return DistributionCache(models.env.configdir, self.distribution_id)
+
+    @property
+    def snapshots(self) -> SnapshotStore:
+        """Snapshot history of the distribution config.
+
+        Returns:
+            SnapshotStore:
+            Snapshot store for the current distribution ID.
+        """
+        return SnapshotStore(models.env.configdir, self.distribution_id)
+
+    @staticmethod
+    def origin_config(
+        distribution_config: Dict[str, Any], origin_name: str
+    ) -> Dict[str, Any]:
+        """Creates a copy of the distribution config with the origin host replaced.
 
         Args:
-            current_config: Current configuration as in CloudFront.
+            distribution_config: Current distribution config.
             origin_name: Origin name that has to be replaced with.
+
+        Returns:
+            Dict[str, Any]:
+            Updated copy of the distribution config.
         """
-        etag = current_config["ETag"]
-        distribution_config = current_config.get("Distribution", {}).get(
-            "DistributionConfig", {}
-        )
+        config = copy.deepcopy(distribution_config)
         item1, item2 = False, False
-        for index, item in enumerate(
-            distribution_config.get("Origins").get("Items", [])
-        ):
+        for item in config.get("Origins", {}).get("Items", []):
             # Distribution -> DistributionConfig -> Origins -> Items -> DomainName
-            if domain_name := item.get("DomainName"):
-                LOGGER.info("DomainName::%s -> %s", domain_name, origin_name)
-                distribution_config["Origins"]["Items"][index][
-                    "DomainName"
-                ] = origin_name
+            if item.get("DomainName"):
+                item["DomainName"] = origin_name
                 item1 = True
             # Distribution -> DistributionConfig -> Origins -> Items -> Id
-            if item_id := item.get("Id"):
-                LOGGER.info("CHANGES: Id::%s -> %s", item_id, origin_name)
-                distribution_config["Origins"]["Items"][index]["Id"] = origin_name
+            if item.get("Id"):
+                item["Id"] = origin_name
                 item2 = True
         if not all((item1, item2)):
             LOGGER.error(distribution_config)
@@ -150,21 +453,89 @@ class CloudFront:
             )
 
         # Distribution -> DistributionConfig -> DefaultCacheBehavior -> TargetOriginId
-        if origin_id := distribution_config.get("DefaultCacheBehavior", {}).get(
-            "TargetOriginId"
-        ):
-            LOGGER.info("CHANGES: TargetOriginId::%s -> %s", origin_id, origin_name)
-            distribution_config["DefaultCacheBehavior"]["TargetOriginId"] = origin_name
+        if config.get("DefaultCacheBehavior", {}).get("TargetOriginId"):
+            config["DefaultCacheBehavior"]["TargetOriginId"] = origin_name
         else:
             LOGGER.error(distribution_config)
             raise ClientError(
                 operation_name="UpdateDistribution",
                 error_response="Missing key `TargetOriginId` in DefaultCacheBehavior",
             )
+        return config
+
+    @staticmethod
+    def restore_config(
+        distribution_config: Dict[str, Any], snapshot: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Creates a copy of the distribution config with the origins restored from a snapshot.
+
+        See Also:
+            Only ``DomainName`` and ``Id`` of each origin, and the ``TargetOriginId`` of the default cache behavior
+            are restored, each from the same key in the snapshot.
+
+        Args:
+            distribution_config: Current distribution config.
+            snapshot: Distribution config from the snapshot.
+
+        Returns:
+            Dict[str, Any]:
+            Updated copy of the distribution config.
+        """
+        config = copy.deepcopy(distribution_config)
+        items = config.get("Origins", {}).get("Items", [])
+        snapshot_items = snapshot.get("Origins", {}).get("Items", [])
+        if len(items) != len(snapshot_items):
+            raise ValueError(
+                f"Snapshot has {len(snapshot_items)} origin(s), but the distribution has {len(items)}"
+            )
+        # Distribution -> DistributionConfig -> Origins -> Items -> DomainName and Id
+        for item, snapshot_item in zip(items, snapshot_items):
+            for key in ("DomainName", "Id"):
+                if snapshot_item.get(key):
+                    item[key] = snapshot_item[key]
+        # Distribution -> DistributionConfig -> DefaultCacheBehavior -> TargetOriginId
+        if target := snapshot.get("DefaultCacheBehavior", {}).get("TargetOriginId"):
+            config.setdefault("DefaultCacheBehavior", {})["TargetOriginId"] = target
+        return config
+
+    @metrics.timed("update_distribution")
+    def update_distribution(
+        self,
+        current_config: Dict[str, Any],
+        origin_name: str,
+        snapshot: Dict[str, Any] | None = None,
+    ) -> List[diff.Change]:
+        """Updates the origin host of a cloudfront distribution, skipping the update when nothing has changed.
+
+        Args:
+            current_config: Current configuration as in CloudFront.
+            origin_name: Origin name that has to be replaced with.
+            snapshot: Distribution config from a snapshot, to restore the origins from instead.
+
+        Returns:
+            List[diff.Change]:
+            List of changes that were applied.
+        """
+        etag = current_config["ETag"]
+        distribution_config = current_config.get("Distribution", {}).get(
+            "DistributionConfig", {}
+        )
+        desired_config = self.desired_config(distribution_config, origin_name, snapshot)
+        changes = diff.diff(distribution_config, desired_config)
+        if not changes:
+            LOGGER.info(
+                "Distribution %s already points to %s, skipping update",
+                self.distribution_id,
+                origin_name,
+            )
+            metrics.CLOUDFRONT_UPDATES.inc(result="unchanged")
+            return changes
+        for change in changes:
+            LOGGER.info("CHANGES: %s", change)
 
         update_response = self.client.update_distribution(
-            DistributionConfig=distribution_config,
-            Id=models.env.distribution_id,
+            DistributionConfig=desired_config,
+            Id=self.distribution_id,
             IfMatch=etag,
         )
         if update_response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) == 200:
@@ -172,52 +543,251 @@ class CloudFront:
                 "CloudFront distribution has been updated. Deployment status: %s",
                 update_response["Distribution"]["Status"],
             )
+            metrics.CLOUDFRONT_UPDATES.inc(result="updated")
+            self.cache.save(update_response)
+            self.last_response = update_response
             self.await_deploy(update_response)
         else:
             raise ClientError(
                 operation_name="UpdateDistribution",
                 error_response=update_response.get("ResponseMetadata"),
             )
+        return changes
 
-    def await_deploy(self, last_response: Dict[str, Any]) -> None:
-        """Waits for the distribution to be deployed.
+    def await_deploy(self, last_response: Dict[str, Any]) -> Future:
+        """Waits for the distribution to be deployed, without blocking the caller.
 
         Args:
             last_response: Last known response from AWS.
+
+        Returns:
+            Future:
+            Future that resolves with the latest distribution, once it is deployed and the snapshot is stored.
         """
-        try:
-            LOGGER.info("Waiting for CloudFront distribution to enter 'Deployed' state")
-            waiter = self.client.get_waiter("distribution_deployed")
-            waiter.wait(
-                Id=models.env.distribution_id,
-                WaiterConfig={"Delay": 120, "MaxAttempts": 5},
+        LOGGER.info("Waiting for CloudFront distribution to enter 'Deployed' state")
+        waiter = DeployWaiter(
+            client=self.client,
+            distribution_id=self.distribution_id,
+            initial_delay=models.env.deploy_initial_delay,
+            max_delay=models.env.deploy_max_delay,
+            factor=models.env.deploy_backoff,
+            deadline=models.env.deploy_timeout,
+            cancel=self.cancel,
+        )
+        # resolved only after the snapshot is stored, so one-off commands can exit as soon as it's done
+        self.deployment = Future()
+        waiter.start().add_done_callback(
+            functools.partial(
+                self._deployed, last_response, time.monotonic(), self.deployment
             )
-            LOGGER.info("CloudFront distribution has been deployed")
-            # Remove last_response, so the latest data can be fetched using a GET request
-            last_response = None
-        except WaiterError as error:
+        )
+        return self.deployment
+
+    def _deployed(
+        self,
+        last_response: Dict[str, Any],
+        started: float,
+        deployment: Future,
+        future: Future,
+    ) -> None:
+        """Callback for the waiter's future, that stores the latest known config and resolves the deployment.
+
+        Args:
+            last_response: Last known response from AWS.
+            started: Time when the deployment started.
+            deployment: Deployment future to resolve with the waiter's outcome.
+            future: Completed waiter future.
+        """
+        if future.cancelled():
+            LOGGER.info("Deployment status check superseded by a newer update")
+            configuration = last_response
+        elif error := future.exception():
             LOGGER.error("Error while waiting for distribution to deploy: %s", error)
-        except KeyboardInterrupt:
-            LOGGER.warning("CloudFront status check suspended")
-        finally:
-            self.store_config(last_response)
+            configuration = last_response
+        else:
+            LOGGER.info("CloudFront distribution has been deployed")
+            metrics.DEPLOY_SECONDS.observe(time.monotonic() - started)
+            # the final status check has the latest data, so there's no need for another GET request
+            configuration = future.result()
+        try:
+            self.store_config(configuration)
+        except Exception as error:
+            LOGGER.error("Failed to store the distribution config: %s", error)
+        if future.cancelled():
+            deployment.cancel()
+        elif error := future.exception():
+            deployment.set_exception(error)
+        else:
+            deployment.set_result(future.result())
 
-    def store_config(self, configuration: Dict[str, Any] = None) -> None:
-        """Stores the cloudfront distribution config in a YAML file locally.
+    @metrics.timed("store_config")
+    def store_config(self, configuration: Dict[str, Any] = None) -> Snapshot:
+        """Stores a snapshot of the cloudfront distribution config locally.
 
         Args:
-            configuration: CloudFront distribution configuration.
+            configuration: Response from CloudFront. Defaults to the last known response.
+
+        Returns:
+            Snapshot:
+            Snapshot of the distribution config.
         """
-        os.makedirs(models.env.configdir, exist_ok=True)
-        configfile = os.path.join(
-            models.env.configdir, datetime.now().strftime("config_%m%d%y.yaml")
+        # the last response is as good as a fresh GET, since every update returns the full config
+        response = configuration or self.last_response or self.get_distribution()
+        return self.snapshots.save(
+            response["Distribution"]["DistributionConfig"], etag=response.get("ETag")
+        )
+
+
+class BulkResult(BaseModel):
+    """BaseModel object for the outcome of a distribution in a bulk update.
+
+    >>> BulkResult
+
+    """
+
+    distribution_id: str
+    status: str
+    attempts: int
+    duration: float
+    changes: List[str] = []
+    error: str | None = None
+
+
+def _bulk_update_one(
+    client: Any,
+    distribution_id: str,
+    origin_name: str,
+    bucket: TokenBucket,
+    attempts: int,
+) -> BulkResult:
+    """Runs the get/update cycle for a single distribution, retrying throttled or stale requests.
+
+    Args:
+        client: Shared CloudFront client.
+        distribution_id: Distribution ID.
+        origin_name: Origin name that has to be replaced with.
+        bucket: Token bucket shared across the bulk update.
+        attempts: Maximum number of attempts.
+
+    Returns:
+        BulkResult:
+        Result of the update.
+    """
+    start = time.monotonic()
+    cache = DistributionCache(models.env.configdir, distribution_id)
+    for attempt in range(1, attempts + 1):
+        try:
+            # every attempt fetches the distribution again, so a PreconditionFailed is retried with a fresh ETag
+            bucket.acquire()
+            with metrics.CLOUDFRONT_SECONDS.time(operation="bulk_get_distribution"):
+                response = client.get_distribution(Id=distribution_id)
+            cache.save(response)
+            current = response["Distribution"]["DistributionConfig"]
+            desired = CloudFront.origin_config(current, origin_name)
+            if not (changes := diff.diff(current, desired)):
+                return BulkResult(
+                    distribution_id=distribution_id,
+                    status="unchanged",
+                    attempts=attempt,
+                    duration=time.monotonic() - start,
+                )
+            bucket.acquire()
+            with metrics.CLOUDFRONT_SECONDS.time(operation="bulk_update_distribution"):
+                update_response = client.update_distribution(
+                    DistributionConfig=desired,
+                    Id=distribution_id,
+                    IfMatch=response["ETag"],
+                )
+            cache.save(update_response)
+            SnapshotStore(models.env.configdir, distribution_id).save(
+                update_response["Distribution"]["DistributionConfig"],
+                etag=update_response.get("ETag"),
+            )
+            return BulkResult(
+                distribution_id=distribution_id,
+                status="updated",
+                attempts=attempt,
+                duration=time.monotonic() - start,
+                changes=[str(change) for change in changes],
+            )
+        except ClientError as error:
+            metrics.CLOUDFRONT_ERRORS.inc(
+                operation="bulk_update", error=error_code(error) or "ClientError"
+            )
+            if error_code(error) not in _RETRYABLE or attempt == attempts:
+                return BulkResult(
+                    distribution_id=distribution_id,
+                    status="failed",
+                    attempts=attempt,
+                    duration=time.monotonic() - start,
+                    error=str(error),
+                )
+            delay = min(0.5 * 2**attempt, 20) * random.uniform(0.5, 1)
+            metrics.CLOUDFRONT_RETRIES.inc(reason=error_code(error))
+            LOGGER.warning(
+                "%s for %s, retrying in %.1fs",
+                error_code(error),
+                distribution_id,
+                delay,
+            )
+            time.sleep(delay)
+        except Exception as error:
+            return BulkResult(
+                distribution_id=distribution_id,
+                status="failed",
+                attempts=attempt,
+                duration=time.monotonic() - start,
+                error=f"{type(error).__name__}: {error}",
+            )
+
+
+def bulk_update(
+    distribution_ids: List[str],
+    public_url: str,
+    max_workers: int | None = None,
+    rate: float | None = None,
+    attempts: int = 5,
+) -> List[BulkResult]:
+    """Points the origin of multiple distributions to the public URL, in parallel.
+
+    Args:
+        distribution_ids: List of distribution IDs.
+        public_url: Public URL from ngrok, that has to be updated.
+        max_workers: Maximum number of distributions to update in parallel. Defaults to ``max_parallel``
+        rate: Maximum number of API calls per second. Defaults to ``api_rate_limit``
+        attempts: Maximum number of attempts per distribution.
+
+    Returns:
+        List[BulkResult]:
+        Results in the same order as the distribution IDs.
+    """
+    origin_name = public_url.removeprefix("https://")
+    client = shared_client()
+    bucket = TokenBucket(rate or models.env.api_rate_limit)
+    with ThreadPoolExecutor(
+        max_workers=max_workers or models.env.max_parallel,
+        thread_name_prefix="bulk-update",
+    ) as executor:
+        results = list(
+            executor.map(
+                lambda distribution_id: _bulk_update_one(
+                    client, distribution_id, origin_name, bucket, attempts
+                ),
+                distribution_ids,
+            )
         )
-        with open(configfile, "w") as file:
-            yaml.dump(
-                stream=file,
-                data=configuration or self.get_distribution(),
-                Dumper=yaml.SafeDumper,
-                sort_keys=False,
-                default_flow_style=False,
-            )
-            file.flush()
+    for result in results:
+        metrics.CLOUDFRONT_UPDATES.inc(result=result.status)
+        if result.error:
+            LOGGER.error(
+                "%s: %s - %s", result.distribution_id, result.status, result.error
+            )
+        else:
+            LOGGER.info(
+                "%s: %s [attempts: %d, duration: %.2fs]",
+                result.distribution_id,
+                result.status,
+                result.attempts,
+                result.duration,
+            )
+    return results
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import marshal
+import os
+from typing import Any, Dict
+
+import yaml
+
+from nctl import metrics
+
+LOGGER = logging.getLogger("nctl.cloudfront")
+
+# libyaml bindings are an order of magnitude faster than the pure-Python implementation, when available
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class DistributionCache:
+    """Stores the last known distribution config and its ETag on disk.
+
+    >>> DistributionCache
+
+    See Also:
+        - The cached ETag is only a hint, CloudFront rejects updates with a stale ETag with ``PreconditionFailed``
+    """
+
+    def __init__(self, configdir: str, distribution_id: str):
+        """Instantiates the cache object for a distribution.
+
+        Args:
+            configdir: Directory where the cache is stored.
+            distribution_id: Distribution ID.
+        """
+        self.filepath = os.path.join(configdir, "cache", f"{distribution_id}.json")
+
+    def load(self) -> Dict[str, Any] | None:
+        """Loads the cached distribution in the same shape as a ``get_distribution`` response.
+
+        Returns:
+            Dict[str, Any]:
+            Cached ``ETag`` and ``DistributionConfig``, or ``None`` if the cache is unavailable.
+        """
+        try:
+            with open(self.filepath) as file:
+                cached = json.load(file)
+            return {
+                "ETag": cached["ETag"],
+                "Distribution": {"DistributionConfig": cached["DistributionConfig"]},
+            }
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError) as error:
+            LOGGER.warning("Ignoring corrupted cache %s: %s", self.filepath, error)
+
+    def save(self, response: Dict[str, Any]) -> None:
+        """Saves the ETag and config from a ``get_distribution`` or ``update_distribution`` response.
+
+        Args:
+            response: Response from CloudFront.
+        """
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        tmp = self.filepath + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(
+                {
+                    "ETag": response["ETag"],
+                    "DistributionConfig": response["Distribution"][
+                        "DistributionConfig"
+                    ],
+                },
+                file,
+                default=str,
+            )
+        os.replace(tmp, self.filepath)
+
+    def clear(self) -> None:
+        """Removes the cached distribution."""
+        try:
+            os.remove(self.filepath)
+        except FileNotFoundError:
+            pass
+
+
+class ParseCache:
+    """Caches parsed YAML files on disk, keyed by the file path, modification time and content hash.
+
+    >>> ParseCache
+
+    See Also:
+        - An unchanged ``mtime`` and size skips reading the file altogether.
+        - A touched but identical file is matched by its SHA-256, so only real edits are parsed again.
+        - Entries are stored with ``marshal``, which loads much faster than parsing YAML.
+    """
+
+    def __init__(self, configdir: str):
+        """Instantiates the cache object.
+
+        Args:
+            configdir: Directory where the cache is stored.
+        """
+        self.directory = os.path.join(configdir, "cache", "parsed")
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, filepath: str) -> str:
+        """Returns the path of the cache entry for a file."""
+        name = hashlib.sha1(filepath.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.marshal")
+
+    def _read(self, filepath: str) -> Dict[str, Any] | None:
+        """Reads the cache entry for a file, if any."""
+        try:
+            with open(self._entry(filepath), "rb") as file:
+                entry = marshal.load(file)
+        except FileNotFoundError:
+            return
+        except (EOFError, ValueError, TypeError) as error:
+            LOGGER.warning("Ignoring corrupted parse cache for %s: %s", filepath, error)
+            return
+        if isinstance(entry, dict) and entry.get("path") == filepath:
+            return entry
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        """Writes a cache entry atomically, skipping data that ``marshal`` can't serialize."""
+        try:
+            payload = marshal.dumps(entry)
+        except ValueError as error:
+            LOGGER.debug("Unable to cache %s: %s", entry["path"], error)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        filepath = self._entry(entry["path"])
+        tmp = filepath + ".tmp"
+        with open(tmp, "wb") as file:
+            file.write(payload)
+        os.replace(tmp, filepath)
+
+    def load(self, filepath: str | os.PathLike) -> Any:
+        """Loads a YAML file, from the cache when it hasn't changed.
+
+        Args:
+            filepath: Path of the YAML file.
+
+        Returns:
+            Any:
+            Parsed content of the file.
+        """
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        entry = self._read(filepath)
+        if entry and (entry["mtime"], entry["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            return self._hit(entry)
+        with open(filepath, "rb") as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry and entry["digest"] == digest:
+            entry.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            self._write(entry)
+            return self._hit(entry)
+        self.misses += 1
+        metrics.PARSE_CACHE.inc(result="miss")
+        data = yaml.load(content, Loader=YAML_LOADER)
+        self._write(
+            dict(
+                path=filepath,
+                mtime=stat.st_mtime_ns,
+                size=stat.st_size,
+                digest=digest,
+                data=data,
+            )
+        )
+        return data
+
+    def _hit(self, entry: Dict[str, Any]) -> Any:
+        """Records a cache hit and returns the cached data."""
+        self.hits += 1
+        metrics.PARSE_CACHE.inc(result="hit")
+        LOGGER.debug("Loaded %s from the parse cache", entry["path"])
+        return entry["data"]
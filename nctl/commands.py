@@ -0,0 +1,120 @@
+import logging
+from typing import List
+
+from nctl import aws, logger, models, profiler, squire
+
+LOGGER = logging.getLogger("nctl.cloudfront")
+
+
+def _setup(command: str, **kwargs) -> None:
+    """Loads the env config, configures logging and starts the profiler for one-off commands.
+
+    Args:
+        command: Name of the command, used to label the profile stats.
+    """
+    models.env = squire.load_env(**kwargs)
+    logger.configure_env("cloudfront")
+    # stopped by the exit hook, once the command returns
+    profiler.start(
+        directory=models.env.profile_dir,
+        label=command,
+        cpu=models.env.profile,
+        memory=models.env.trace_memory,
+        frames=models.env.trace_memory_frames,
+        top=models.env.profile_top,
+    )
+
+
+def rollback(to: str | None = None, **kwargs) -> bool:
+    """Restores the origin of the mapped distributions from a stored snapshot, and waits for the deployment.
+
+    Args:
+        to: Full or abbreviated snapshot ID. Defaults to the snapshot before the latest one of each distribution.
+
+    Returns:
+        bool:
+        Flag to indicate whether the rollback succeeded.
+    """
+    _setup("rollback", **kwargs)
+    targets = []
+    for mapping in models.env.mappings():
+        if not mapping.distribution_id:
+            LOGGER.warning("Skipping %r, no distribution ID to roll back", mapping.name)
+            continue
+        cloudfront = aws.CloudFront(tunnel=mapping)
+        if to and not any(
+            snapshot.id.startswith(to) for snapshot in cloudfront.snapshots.list()
+        ):
+            continue
+        targets.append(cloudfront)
+    if not targets:
+        if to:
+            LOGGER.error("No distribution has a snapshot matching %r", to)
+        return False
+    success = True
+    for cloudfront in targets:
+        try:
+            cloudfront.rollback(to)
+        except Exception as error:
+            LOGGER.error(
+                "Failed to roll back %s: %s", cloudfront.distribution_id, error
+            )
+            success = False
+    # the deployments are awaited in parallel, since each waiter polls on its own thread
+    for cloudfront in targets:
+        if not cloudfront.deployment:
+            continue
+        try:
+            cloudfront.deployment.result()
+        except Exception as error:
+            LOGGER.error("Failed to deploy %s: %s", cloudfront.distribution_id, error)
+            success = False
+    return success
+
+
+def plan(url: str | None = None, **kwargs) -> bool:
+    """Prints the changes that pointing the mapped distributions to the public URL would apply, without updating.
+
+    Args:
+        url: Public URL to plan for, with or without the ``https://`` prefix.
+
+    Returns:
+        bool:
+        Flag to indicate whether the plan could be computed for all the distributions.
+    """
+    _setup("plan", **kwargs)
+    if not url:
+        LOGGER.error("A public URL is required to plan the changes")
+        return False
+    origin = url.removeprefix("https://")
+    distributions: List[aws.CloudFront] = []
+    for mapping in models.env.mappings():
+        if not mapping.distribution_id:
+            LOGGER.warning(
+                "Skipping %r, the distribution doesn't exist yet", mapping.name
+            )
+            continue
+        distributions.append(aws.CloudFront(tunnel=mapping))
+        distributions.extend(
+            aws.CloudFront(
+                tunnel=mapping.model_copy(
+                    update={"distribution_id": distribution_id, "distribution_ids": []}
+                )
+            )
+            for distribution_id in mapping.distribution_ids
+        )
+    success = True
+    for cloudfront in distributions:
+        try:
+            changes = cloudfront.plan(origin)
+        except Exception as error:
+            LOGGER.error("Failed to plan %s: %s", cloudfront.distribution_id, error)
+            success = False
+            continue
+        if not changes:
+            print(f"{cloudfront.distribution_id}: no changes")
+            continue
+        print(f"{cloudfront.distribution_id}: {len(changes)} change(s)")
+        for change in changes:
+            print(f"  ~ {change}")
+    return success
@@ -0,0 +1,54 @@
+from typing import Any, List, NamedTuple
+
+
+class Change(NamedTuple):
+    """Single change between two configurations.
+
+    >>> Change
+
+    """
+
+    path: str
+    old: Any
+    new: Any
+
+    def __str__(self) -> str:
+        """Renders the change as ``path: old -> new``"""
+        return f"{self.path}: {self.old!r} -> {self.new!r}"
+
+
+_MISSING = object()
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Change]:
+    """Computes the minimal set of changes between two JSON-like structures.
+
+    Args:
+        old: Original structure.
+        new: Updated structure.
+        path: Path prefix of the structures, used for recursion.
+
+    Returns:
+        List[Change]:
+        List of changes, with dotted paths for keys and ``[index]`` for list items.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in old.keys() | new.keys():
+            key_path = f"{path}.{key}" if path else str(key)
+            left, right = old.get(key, _MISSING), new.get(key, _MISSING)
+            if left is _MISSING:
+                changes.append(Change(key_path, None, right))
+            elif right is _MISSING:
+                changes.append(Change(key_path, left, None))
+            else:
+                changes.extend(diff(left, right, key_path))
+        return sorted(changes)
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for index, (left, right) in enumerate(zip(old, new)):
+            changes.extend(diff(left, right, f"{path}[{index}]"))
+        return changes
+    if old != new:
+        return [Change(path, old, new)]
+    return []
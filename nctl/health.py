@@ -0,0 +1,130 @@
+import http.client
+import logging
+import threading
+import time
+from typing import List
+from urllib.parse import urlparse
+
+from nctl import metrics
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+
+class Probe:
+    """Keep-alive HTTP probe that checks an origin for the expected status code.
+
+    >>> Probe
+
+    See Also:
+        - A single connection is reused across checks, and re-established only when it breaks.
+        - The response body is drained, so that the connection can be reused.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        path: str = "/",
+        expected_status: int = 200,
+        timeout: float = 2,
+        name: str = "local",
+    ):
+        """Instantiates the probe without connecting.
+
+        Args:
+            base_url: Base URL of the origin, eg: ``http://127.0.0.1:8080``
+            path: Path to request.
+            expected_status: Status code that marks the origin as healthy.
+            timeout: Socket timeout for each request.
+            name: Name of the probe, used as the metric label.
+        """
+        parsed = urlparse(base_url)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or (443 if self.https else 80)
+        self.path = path
+        self.expected_status = expected_status
+        self.timeout = timeout
+        self.name = name
+        self._connection: http.client.HTTPConnection | None = None
+
+    def check(self) -> bool:
+        """Requests the path once, and records the latency.
+
+        Returns:
+            bool:
+            Flag to indicate whether the response had the expected status code.
+        """
+        if not self._connection:
+            connection = (
+                http.client.HTTPSConnection
+                if self.https
+                else http.client.HTTPConnection
+            )
+            self._connection = connection(self.host, self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            self._connection.request("GET", self.path)
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as error:
+            LOGGER.debug("Probe %s failed: %s", self.name, error)
+            metrics.PROBE_FAILURES.inc(probe=self.name, reason=type(error).__name__)
+            self.close()
+            return False
+        finally:
+            metrics.PROBE_SECONDS.observe(time.perf_counter() - start, probe=self.name)
+        if response.will_close:
+            self.close()
+        if response.status != self.expected_status:
+            LOGGER.debug(
+                "Probe %s returned %d, expected %d",
+                self.name,
+                response.status,
+                self.expected_status,
+            )
+            metrics.PROBE_FAILURES.inc(probe=self.name, reason=str(response.status))
+            return False
+        return True
+
+    def close(self) -> None:
+        """Closes the underlying connection."""
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+def wait_healthy(
+    probes: List[Probe],
+    successes: int,
+    interval: float,
+    timeout: float,
+    cancel: threading.Event | None = None,
+) -> bool:
+    """Waits until every probe succeeds for the given number of consecutive rounds.
+
+    Args:
+        probes: Probes to check in each round.
+        successes: Number of consecutive successful rounds required.
+        interval: Interval between rounds.
+        timeout: Maximum time to wait.
+        cancel: Event to abort waiting.
+
+    Returns:
+        bool:
+        Flag to indicate whether the probes succeeded within the timeout.
+    """
+    cancel = cancel or threading.Event()
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while not cancel.is_set():
+        # every probe runs in each round, so the connections stay warm
+        if all([probe.check() for probe in probes]):
+            streak += 1
+            if streak >= successes:
+                return True
+        else:
+            streak = 0
+        if (remaining := deadline - time.monotonic()) <= 0:
+            return False
+        cancel.wait(min(interval, remaining))
+    return False
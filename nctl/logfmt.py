@@ -0,0 +1,240 @@
+from typing import Dict, List, NamedTuple
+
+# levels are decoded once, since ngrok only uses a handful of them
+_LEVELS: Dict[bytes, str] = {}
+# marks the frames whose fields are parsed only when used, compared by identity
+_UNPARSED: Dict[str, str] = {}
+
+
+class Frame(NamedTuple):
+    """Structured representation of a single logfmt line from ngrok.
+
+    >>> Frame
+
+    """
+
+    t: str | None = None
+    lvl: str | None = None
+    msg: str | None = None
+    obj: str | None = None
+    url: str | None = None
+    addr: str | None = None
+    err: str | None = None
+    extra: Dict[str, str] = {}
+    raw: bytes = b""
+
+    @property
+    def parsed(self) -> bool:
+        """Indicates whether the fields have been parsed, as opposed to only the level."""
+        return self.extra is not _UNPARSED
+
+    def resolve(self) -> "Frame":
+        """Returns the fully parsed frame, parsing the raw line only if it hasn't been already.
+
+        Returns:
+            Frame:
+            Parsed frame.
+        """
+        return self if self.extra is not _UNPARSED else parse(self.raw)
+
+    def fields(self) -> Dict[str, str]:
+        """Returns all the available key-value pairs except ``t``, ``lvl`` and ``msg``.
+
+        Returns:
+            Dict[str, str]:
+            Ordered dictionary of the remaining fields.
+        """
+        if self.extra is _UNPARSED:
+            return self.resolve().fields()
+        fields = {}
+        for key in ("obj", "addr", "url", "err"):
+            if (value := getattr(self, key)) is not None:
+                fields[key] = value
+        fields.update(self.extra)
+        return fields
+
+    def __str__(self) -> str:
+        """Renders the message followed by the remaining fields, formatted only when a record is emitted."""
+        # most lines are rendered straight from the raw line, without parsing the fields
+        if self.raw and (rendered := render(self.raw)) is not None:
+            return rendered
+        if self.extra is _UNPARSED:
+            return str(self.resolve())
+        return " ".join(
+            (self.msg or "", *(f"{k}={v}" for k, v in self.fields().items()))
+        ).strip()
+
+
+def _split(text: str) -> Dict[str, str]:
+    """Splits a line without escaped quotes into key-value pairs using only C-level string methods."""
+    pairs = {}
+    # even indices are outside the quotes, odd indices are the quoted values
+    parts = text.split('"')
+    for index in range(0, len(parts), 2):
+        tokens = parts[index].split()
+        for token in tokens:
+            key, sep, value = token.partition("=")
+            if sep:
+                pairs[key] = value
+        if tokens and index + 1 < len(parts) and parts[index].endswith("="):
+            pairs[tokens[-1][:-1]] = parts[index + 1]
+    return pairs
+
+
+def _unescape(pairs: Dict[str, str]) -> Dict[str, str]:
+    """Restores the escaped characters that were swapped with placeholders before splitting."""
+    for key, value in pairs.items():
+        if "\x00" in value or "\x01" in value:
+            pairs[key] = value.replace("\x00", '"').replace("\x01", "\\")
+    return pairs
+
+
+def level(line: bytes) -> str | None:
+    """Finds the value of ``lvl`` on the raw bytes, without decoding or tokenizing the line.
+
+    Args:
+        line: Raw bytes of a single line from ngrok's stdout.
+
+    Returns:
+        str:
+        Log level, or ``None`` when the line has no ``lvl`` key.
+    """
+    # the key is either preceded by a space or the first one, eg: not 'loglvl='
+    _, sep, rest = line.partition(b" lvl=")
+    if not sep:
+        if not line.startswith(b"lvl="):
+            return
+        rest = line[4:]
+    raw = rest.partition(b" ")[0]
+    if (lvl := _LEVELS.get(raw)) is None:
+        lvl = _LEVELS.setdefault(raw, raw.decode(errors="replace").strip('"'))
+    return lvl
+
+
+def render(line: bytes) -> str | None:
+    """Renders the message followed by the remaining fields on the raw line, without tokenizing it.
+
+    Args:
+        line: Raw bytes of a single line from ngrok's stdout.
+
+    Returns:
+        str:
+        Message followed by the fields other than ``t`` and ``lvl`` with the quotes removed, in the order they appear
+        on the line. ``None`` for lines without ``msg`` after another field, eg: ``t`` and ``lvl``
+    """
+    text = line.decode(errors="replace")
+    if escaped := "\\" in text:
+        # swap escaped characters with placeholders, the same way as 'parse'
+        text = text.replace("\\\\", "\x01").replace('\\"', "\x00")
+    # ngrok always starts a line with 't' and 'lvl' followed by 'msg', so whatever precedes 'msg' is skipped
+    _, sep, text = text.partition(" msg=")
+    if not sep:
+        return
+    if text.startswith('"'):
+        msg, quote, rest = text[1:].partition('"')
+        if not quote:
+            return
+        rendered = msg + rest.replace('"', "") if rest else msg
+    else:
+        rendered = text.replace('"', "")
+    if escaped:
+        return rendered.replace("\x00", '"').replace("\x01", "\\")
+    return rendered
+
+
+def parse(line: bytes) -> Frame:
+    """Parses a single logfmt line into a ``Frame`` in one pass.
+
+    Args:
+        line: Raw bytes of a single line from ngrok's stdout.
+
+    Returns:
+        Frame:
+        Returns the parsed frame. Lines without any ``key=value`` pairs will have all fields set to ``None``.
+    """
+    text = line.decode(errors="replace")
+    if "\\" in text:
+        # swap escaped characters with placeholders, so that the quotes can be split naively
+        pairs = _unescape(_split(text.replace("\\\\", "\x01").replace('\\"', "\x00")))
+    else:
+        pairs = _split(text)
+    pop = pairs.pop
+    return Frame(
+        pop("t", None),
+        pop("lvl", None),
+        pop("msg", None),
+        pop("obj", None),
+        pop("url", None),
+        pop("addr", None),
+        pop("err", None),
+        pairs,
+        line,
+    )
+
+
+class Tokenizer:
+    """Incremental tokenizer that converts arbitrary chunks of bytes into frames.
+
+    >>> Tokenizer
+
+    """
+
+    __slots__ = ("_partial", "_lazy")
+
+    def __init__(self, lazy: bool = False):
+        """Instantiates an empty buffer for the trailing partial line.
+
+        Args:
+            lazy: Boolean flag to only read the level of each line, and parse the rest when the frame is used.
+        """
+        self._partial = b""
+        self._lazy = lazy
+
+    def _frames(self, lines: List[bytes]) -> List[Frame]:
+        """Parses the non-empty lines, or only reads their level when lazy."""
+        if not self._lazy:
+            return [parse(line) for raw in lines if (line := raw.strip())]
+        # lines that are never logged, eg: 'dbug', are never decoded or tokenized
+        # tuple.__new__ skips the keyword handling of the namedtuple constructor on every line, and the levels
+        # seen before are looked up inline, falling back to 'level' for new ones and lines that start with 'lvl='
+        new, seen = tuple.__new__, _LEVELS.get
+        return [
+            new(
+                Frame,
+                (
+                    None,
+                    seen(line.partition(b" lvl=")[2].partition(b" ")[0]) or level(line),
+                    None,
+                    None,
+                    None,
+                    None,
+                    None,
+                    _UNPARSED,
+                    line,
+                ),
+            )
+            for raw in lines
+            if (line := raw.strip())
+        ]
+
+    def feed(self, chunk: bytes) -> List[Frame]:
+        """Feeds a chunk of bytes and returns every complete line as a frame.
+
+        Args:
+            chunk: Raw bytes read from the stream.
+
+        Returns:
+            List[Frame]:
+            Parsed frame for every complete line in the chunk.
+        """
+        if self._partial:
+            chunk = self._partial + chunk
+        lines = chunk.split(b"\n")
+        # the last element is either empty, or an incomplete line that continues in the next chunk
+        self._partial = lines.pop()
+        return self._frames(lines)
+
+    def flush(self) -> List[Frame]:
+        """Returns the remaining partial line, if any, as a frame."""
+        partial, self._partial = self._partial, b""
+        return self._frames([partial])
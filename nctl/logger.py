@@ -1,15 +1,24 @@
+import atexit
+import gzip
 import json
 import logging.config
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import Any, Dict
 
 import yaml
-from pydantic import BaseModel, FilePath
+from pydantic import BaseModel, FilePath, NonNegativeInt, PositiveInt
 
-from nctl import models
+from nctl import logfmt, models
 
 LOGGER = logging.getLogger("nctl.tunnel")
+PIPELINE: "LogPipeline | None" = None
+# file handlers by absolute path, shared by the loggers that write to the same file
+FILE_HANDLERS: Dict[str, logging.Handler] = {}
 
 
 class AddProcessName(logging.Filter):
@@ -32,6 +41,412 @@ class AddProcessName(logging.Filter):
         return True
 
 
+class JsonFormatter(logging.Formatter):
+    """Formatter that renders each record as a compact JSON object on a single line.
+
+    >>> JsonFormatter
+
+    See Also:
+        - Records logged with a ``logfmt.Frame`` as the message, carry the original logfmt fields from ngrok as keys.
+        - A single pre-built encoder is reused, so the C accelerated serializer is hit directly.
+    """
+
+    encoder = json.JSONEncoder(
+        separators=(",", ":"), ensure_ascii=False, check_circular=False, default=str
+    )
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Serializes the record along with the ngrok fields, if any."""
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "module": record.module,
+            "line": record.lineno,
+        }
+        if isinstance(record.msg, logfmt.Frame):
+            frame = record.msg.resolve()
+            payload["message"] = frame.msg
+            if frame.t:
+                payload["t"] = frame.t
+            payload["lvl"] = frame.lvl
+            payload.update(frame.fields())
+        else:
+            payload["message"] = record.getMessage()
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return self.encoder.encode(payload)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str = None) -> str:
+        """Formats the timestamp in ISO 8601 with milliseconds and the local offset."""
+        return (
+            datetime.fromtimestamp(record.created)
+            .astimezone()
+            .isoformat(timespec="milliseconds")
+        )
+
+
+class BatchFlushMixin:
+    """Mixin for stream handlers that defers flushing to the end of each batch from the queue listener.
+
+    >>> BatchFlushMixin
+
+    """
+
+    batched = True
+
+    def flush(self) -> None:
+        """Skips the flush after every record while batched, the listener calls ``flush_batch`` instead."""
+        if not self.batched:
+            super().flush()
+
+    def flush_batch(self) -> None:
+        """Flushes the stream once for the whole batch."""
+        super().flush()
+
+    def close(self) -> None:
+        """Flushes the pending batch before closing the stream."""
+        self.flush_batch()
+        super().close()
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    """Stream handler that flushes once per batch.
+
+    >>> BatchStreamHandler
+
+    """
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    """File handler that flushes once per batch.
+
+    >>> BatchFileHandler
+
+    """
+
+
+class RotatingLogHandler(logging.handlers.BaseRotatingHandler):
+    """File handler that rotates by size and/or at midnight, and compresses the rotated segments.
+
+    >>> RotatingLogHandler
+
+    See Also:
+        - Rotated segments are named with the time of rotation, eg: ``nctl.log.2024-08-17_00-00-00.gz``
+        - Compression and retention run on a background thread, so the rotation doesn't stall logging.
+        - The size of the active file is tracked as records are written, so each record is formatted only once.
+        - A single handler must be shared by all the loggers that write to the same file, see ``FILE_HANDLERS``
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 0,
+        midnight: bool = False,
+        backup_count: int = 7,
+        compress: bool = True,
+    ):
+        """Instantiates the handler.
+
+        Args:
+            filename: Path of the active log file.
+            max_bytes: Size in bytes that triggers a rotation, ``0`` disables size based rotation.
+            midnight: Boolean flag to rotate at midnight.
+            backup_count: Number of rotated segments to retain.
+            compress: Boolean flag to gzip the rotated segments.
+        """
+        self.size = 0
+        super().__init__(filename, mode="a", encoding="utf-8")
+        self.max_bytes = max_bytes
+        self.midnight = midnight
+        self.backup_count = backup_count
+        self.rollover_at = self._next_midnight() if midnight else None
+        self.executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-archiver")
+            if compress
+            else None
+        )
+
+    @staticmethod
+    def _next_midnight() -> float:
+        """Returns the timestamp of the upcoming local midnight."""
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+    def _open(self):
+        """Opens the active file, and starts the running size from its current size."""
+        stream = super()._open()
+        self.size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def shouldRollover(self, record: logging.LogRecord, length: int = 0) -> bool:
+        """Determines if the file should be rotated before emitting the record.
+
+        Args:
+            record: Record to be emitted.
+            length: Length of the formatted record, added to the size written so far.
+        """
+        if self.rollover_at and record.created >= self.rollover_at:
+            return True
+        return bool(self.max_bytes) and self.size + length >= self.max_bytes
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Formats the record once, rotates the file if needed, and writes the record."""
+        try:
+            msg = self.format(record) + self.terminator
+            if self.shouldRollover(record, len(msg)):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            # characters rather than bytes, the same approximation as 'RotatingFileHandler'
+            self.size += len(msg)
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def doRollover(self) -> None:
+        """Renames the active file with a timestamp, and hands it over for compression and retention."""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        destination = (
+            f"{self.baseFilename}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        )
+        index = 1
+        while os.path.exists(destination) or os.path.exists(f"{destination}.gz"):
+            destination = f"{destination.rsplit('~', 1)[0]}~{index}"
+            index += 1
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, destination)
+            if self.executor:
+                self.executor.submit(self._archive, destination)
+            else:
+                self._prune()
+        if self.midnight:
+            self.rollover_at = self._next_midnight()
+        self.stream = self._open()
+
+    def _archive(self, source: str) -> None:
+        """Compresses a rotated segment, and removes the segments beyond the retention cap."""
+        with open(source, "rb") as src, gzip.open(f"{source}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+        self._prune()
+
+    def _prune(self) -> None:
+        """Removes the oldest rotated segments beyond the retention cap."""
+        directory, basename = os.path.split(self.baseFilename)
+        segments = sorted(
+            name
+            for name in os.listdir(directory or ".")
+            if name.startswith(f"{basename}.")
+        )
+        for name in segments[: max(len(segments) - self.backup_count, 0)]:
+            os.remove(os.path.join(directory, name))
+
+    def close(self) -> None:
+        """Waits for pending archives before closing the file."""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        super().close()
+
+
+class BatchRotatingLogHandler(BatchFlushMixin, RotatingLogHandler):
+    """Rotating file handler that flushes once per batch.
+
+    >>> BatchRotatingLogHandler
+
+    """
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that either drops or blocks when the queue is full.
+
+    >>> BoundedQueueHandler
+
+    """
+
+    def __init__(self, log_queue: queue.Queue, block: bool):
+        """Instantiates the handler.
+
+        Args:
+            log_queue: Bounded queue shared with the listener.
+            block: Boolean flag to block the caller instead of dropping the record, when the queue is full.
+        """
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Skips formatting on the caller's thread, since the listener lives in the same process."""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Puts the record in the queue, dropping it if the queue is full and blocking is disabled."""
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """Queue listener that drains records in batches and flushes the handlers once per batch.
+
+    >>> BatchQueueListener
+
+    See Also:
+        - The loggers share the queue, so each record is routed only to the handler of the logger it came from.
+    """
+
+    def __init__(self, log_queue: queue.Queue, batch_size: int = 512):
+        """Instantiates the listener without any handlers.
+
+        Args:
+            log_queue: Bounded queue shared with the queue handlers.
+            batch_size: Maximum number of records to handle before flushing.
+        """
+        super().__init__(log_queue, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.routes: Dict[str, logging.Handler] = {}
+
+    def route(self, name: str, handler: logging.Handler) -> None:
+        """Routes the records of a logger, and its children, to the handler.
+
+        Args:
+            name: Name of the logger.
+            handler: Handler that emits the records.
+        """
+        self.routes[name] = handler
+        # a handler shared by several loggers is flushed only once per batch
+        if handler not in self.handlers:
+            self.handlers += (handler,)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        """Overrides the built-in method to emit the record only with the handler of its logger."""
+        name = record.name
+        while (handler := self.routes.get(name)) is None and "." in name:
+            name = name.rpartition(".")[0]
+        if handler and record.levelno >= handler.level:
+            handler.handle(self.prepare(record))
+
+    def enqueue_sentinel(self) -> None:
+        """Overrides the built-in method to wait for a free slot, since the queue is bounded."""
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        """Overrides the built-in monitor to handle the records in batches."""
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                self.queue.task_done()
+            for handler in self.handlers:
+                if isinstance(handler, BatchFlushMixin):
+                    handler.flush_batch()
+            if stop:
+                return
+
+
+class LogPipeline:
+    """Non-blocking logging pipeline shared by all the loggers in the process.
+
+    >>> LogPipeline
+
+    """
+
+    def __init__(self, size: int, block: bool):
+        """Instantiates the queue, the queue handler and the listener.
+
+        Args:
+            size: Maximum number of records in the queue.
+            block: Boolean flag to block the caller instead of dropping the record, when the queue is full.
+        """
+        self.queue = queue.Queue(maxsize=size)
+        self.handler = BoundedQueueHandler(self.queue, block)
+        self.listener = BatchQueueListener(self.queue)
+        self.loggers: Dict[logging.Logger, logging.Handler] = {}
+
+    def add(self, logger: logging.Logger, handler: logging.Handler) -> None:
+        """Routes the logger through the queue, with the handler attached to the listener.
+
+        Args:
+            logger: Logger that produces the records.
+            handler: Handler that emits the records.
+        """
+        self.loggers[logger] = handler
+        self.listener.route(logger.name, handler)
+        logger.addHandler(self.handler)
+        if not self.listener._thread:
+            self.listener.start()
+
+    def stop(self) -> None:
+        """Stops the listener after draining the queue, and attaches the handlers back to their loggers."""
+        if self.listener._thread:
+            self.listener.stop()
+        for logger, handler in self.loggers.items():
+            logger.removeHandler(self.handler)
+            if isinstance(handler, BatchFlushMixin):
+                handler.flush_batch()
+                handler.batched = False
+            logger.addHandler(handler)
+        self.loggers.clear()
+        if self.handler.dropped:
+            LOGGER.warning("%d log records were dropped", self.handler.dropped)
+
+
+def shutdown() -> None:
+    """Drains and stops the logging pipeline, if any."""
+    global PIPELINE
+    if PIPELINE:
+        PIPELINE.stop()
+        PIPELINE = None
+
+
+def _shared(handler: logging.Handler) -> bool:
+    """Checks if the handler is still attached to any other logger."""
+    return any(
+        handler in log.handlers
+        for log in list(logging.Logger.manager.loggerDict.values())
+        if isinstance(log, logging.Logger)
+    )
+
+
+def reset(process: str) -> None:
+    """Drains the logging pipeline and detaches the handlers and filters, so that logging can be configured again.
+
+    Args:
+        process: Name of the process used in ``configure_logging``
+    """
+    shutdown()
+    log = logging.getLogger(f"nctl.{process}")
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        if _shared(handler):
+            continue
+        for logfile, shared in list(FILE_HANDLERS.items()):
+            if shared is handler:
+                del FILE_HANDLERS[logfile]
+        handler.close()
+    for log_filter in list(log.filters):
+        log.removeFilter(log_filter)
+
+
 class LogConfig(BaseModel):
     """BaseModel object for log configurations.
 
@@ -43,6 +458,14 @@ class LogConfig(BaseModel):
     log: models.LogOptions
     process: str | None = None
     log_config: Dict[str, Any] | FilePath | None = None
+    log_format: models.LogFormatOptions = models.LogFormatOptions.text
+    log_queue: bool = False
+    log_queue_size: PositiveInt = 10_000
+    log_overflow: models.OverflowOptions = models.OverflowOptions.drop
+    log_max_bytes: NonNegativeInt = 0
+    log_rotate_midnight: bool = False
+    log_backup_count: PositiveInt = 7
+    log_compress: bool = True
 
     class Config:
         """Extra configuration for LogConfig object."""
@@ -50,6 +473,29 @@ class LogConfig(BaseModel):
         extra = "ignore"
 
 
+def configure_env(*processes: str) -> None:
+    """Configures logging for each of the processes, with every logging option from the current env config.
+
+    Args:
+        processes: Names of the processes to configure, defaults to both ``tunnel`` and ``cloudfront``
+    """
+    for process in processes or ("tunnel", "cloudfront"):
+        configure_logging(
+            debug=models.env.debug,
+            log_config=models.env.log_config,
+            process=process,
+            log=models.env.log,
+            log_format=models.env.log_format,
+            log_queue=models.env.log_queue,
+            log_queue_size=models.env.log_queue_size,
+            log_overflow=models.env.log_overflow,
+            log_max_bytes=models.env.log_max_bytes,
+            log_rotate_midnight=models.env.log_rotate_midnight,
+            log_backup_count=models.env.log_backup_count,
+            log_compress=models.env.log_compress,
+        )
+
+
 def configure_logging(**kwargs) -> None:
     """Configure logging based on the parameters.
 
@@ -57,6 +503,14 @@ def configure_logging(**kwargs) -> None:
         debug: Boolean flag to enable/disable debug mode.
         process: Name of the process to add a process name filter to default logging.
         log_config: Custom logging configuration.
+        log_format: Format of the log records, either ``text`` or ``json``
+        log_queue: Boolean flag to emit the records from a queue listener thread.
+        log_queue_size: Maximum number of records in the queue.
+        log_overflow: Policy when the queue is full, either ``drop`` or ``block``
+        log_max_bytes: Size in bytes that rotates the log file.
+        log_rotate_midnight: Boolean flag to rotate the log file at midnight.
+        log_backup_count: Number of rotated log files to retain.
+        log_compress: Boolean flag to gzip the rotated log files.
     """
     config = LogConfig(**kwargs)
     if not config.process:
@@ -88,16 +542,51 @@ def configure_logging(**kwargs) -> None:
             datefmt="%b-%d-%Y %I:%M:%S %p",
             fmt="%(asctime)s - %(levelname)s - [%(module)s:%(processName)s:%(lineno)d] - %(funcName)s - %(message)s",
         )
+        if config.log_format == models.LogFormatOptions.json:
+            default_formatter = JsonFormatter()
         if models.env.log == models.LogOptions.stdout:
-            handler = logging.StreamHandler()
+            handler_class = (
+                BatchStreamHandler if config.log_queue else logging.StreamHandler
+            )
+            handler = handler_class()
+        elif config.log_max_bytes or config.log_rotate_midnight:
+            os.makedirs("logs", exist_ok=True)
+            logfile = os.path.abspath(os.path.join("logs", "nctl.log"))
+            # the loggers share the handler, since separate handlers would rotate the same file independently
+            if not (handler := FILE_HANDLERS.get(logfile)):
+                handler_class = (
+                    BatchRotatingLogHandler if config.log_queue else RotatingLogHandler
+                )
+                handler = FILE_HANDLERS[logfile] = handler_class(
+                    filename=logfile,
+                    max_bytes=config.log_max_bytes,
+                    midnight=config.log_rotate_midnight,
+                    backup_count=config.log_backup_count,
+                    compress=config.log_compress,
+                )
         else:
-            logfile: str = datetime.now().strftime(
-                os.path.join("logs", "nctl_%d-%m-%Y.log")
+            logfile: str = os.path.abspath(
+                datetime.now().strftime(os.path.join("logs", "nctl_%d-%m-%Y.log"))
             )
             os.makedirs("logs", exist_ok=True)
-            handler = logging.FileHandler(logfile)
+            if not (handler := FILE_HANDLERS.get(logfile)):
+                handler_class = (
+                    BatchFileHandler if config.log_queue else logging.FileHandler
+                )
+                handler = FILE_HANDLERS[logfile] = handler_class(logfile)
         handler.setFormatter(default_formatter)
-        logging.getLogger(f"nctl.{config.process}").addHandler(handler)
+        if config.log_queue:
+            global PIPELINE
+            if not PIPELINE:
+                PIPELINE = LogPipeline(
+                    size=config.log_queue_size,
+                    block=config.log_overflow == models.OverflowOptions.block,
+                )
+                atexit.register(shutdown)
+            # records are formatted and written on the listener thread, away from the caller's hot path
+            PIPELINE.add(logging.getLogger(f"nctl.{config.process}"), handler)
+        else:
+            logging.getLogger(f"nctl.{config.process}").addHandler(handler)
         logging.getLogger(f"nctl.{config.process}").addFilter(
             filter=AddProcessName(process_name=config.process)
         )
@@ -0,0 +1,472 @@
+import bisect
+import contextlib
+import functools
+import http.server
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+# seconds, covering both sub-second API calls and CloudFront deployments
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Metric:
+    """Base class for a metric family, with values keyed by the label values.
+
+    >>> Metric
+
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Instantiates the metric family.
+
+        Args:
+            name: Name of the metric.
+            documentation: Help text for the metric.
+            labelnames: Names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Orders the label values by the label names."""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], **extra: str) -> str:
+        """Renders the label set in the exposition format."""
+        pairs = list(zip(self.labelnames, key)) + list(extra.items())
+        if not pairs:
+            return ""
+        rendered = ",".join(
+            '%s="%s"'
+            % (
+                name,
+                value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""),
+            )
+            for name, value in pairs
+        )
+        return f"{{{rendered}}}"
+
+    def value(self, **labels: str) -> float | None:
+        """Returns the current value for the label values.
+
+        Args:
+            labels: Label values.
+
+        Returns:
+            float:
+            Current value, or ``None`` if it was never recorded.
+        """
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def samples(self) -> List[str]:
+        """Renders the samples of the metric family.
+
+        Returns:
+            List[str]:
+            List of sample lines.
+        """
+        with self._lock:
+            return [
+                f"{self.name}{self._labels(key)} {value}"
+                for key, value in self._values.items()
+            ]
+
+    def render(self) -> List[str]:
+        """Renders the metric family in the text exposition format.
+
+        Returns:
+            List[str]:
+            List of lines including the ``HELP`` and ``TYPE`` headers.
+        """
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """Monotonically increasing counter.
+
+    >>> Counter
+
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increments the counter.
+
+        Args:
+            amount: Amount to increment by.
+            labels: Label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def bind(self, **labels: str) -> Callable[[], None]:
+        """Binds the label values once, for counters incremented on every line by a single thread at a time.
+
+        Args:
+            labels: Label values.
+
+        Returns:
+            Callable:
+            Function that increments the counter by one.
+
+        See Also:
+            - The increment skips the lock, since only the ngrok writer increments a bound series, and the handlers
+              are dispatched one frame at a time. Readers still see a consistent value, as the dict is only assigned.
+        """
+        key = self._key(labels)
+        values = self._values
+        # a new series changes the size of the dict, so it is added under the lock that 'samples' iterates with
+        with self._lock:
+            values.setdefault(key, 0)
+
+        def inc() -> None:
+            values[key] += 1
+
+        return inc
+
+
+class Gauge(Metric):
+    """Value that can go up and down.
+
+    >>> Gauge
+
+    """
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """Sets the gauge.
+
+        Args:
+            value: Current value.
+            labels: Label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Histogram with cumulative buckets, sum and count.
+
+    >>> Histogram
+
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """Instantiates the histogram.
+
+        Args:
+            name: Name of the metric.
+            documentation: Help text for the metric.
+            labelnames: Names of the labels.
+            buckets: Upper bounds of the buckets, in increasing order.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Records an observation.
+
+        Args:
+            value: Observed value.
+            labels: Label values.
+        """
+        key = self._key(labels)
+        # counts per bucket, the overflow bucket, then the sum
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if not (histogram := self._histograms.get(key)):
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the time taken by the block.
+
+        Args:
+            labels: Label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        """Renders the cumulative buckets, sum and count of each label set."""
+        lines = []
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket{self._labels(key, le=str(bound))} {cumulative}"
+                    )
+                lines.append(f"{self.name}_sum{self._labels(key)} {histogram[-1]}")
+                lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metric families.
+
+    >>> Registry
+
+    """
+
+    def __init__(self):
+        """Instantiates an empty registry."""
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Adds a metric family to the registry.
+
+        Args:
+            metric: Metric family.
+
+        Returns:
+            Metric:
+            The registered metric family.
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name!r} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Renders all the metric families in the text exposition format.
+
+        Returns:
+            str:
+            Exposition text.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filepath: str) -> None:
+        """Writes the metrics to a file atomically.
+
+        Args:
+            filepath: Path of the file.
+        """
+        if directory := os.path.dirname(filepath):
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{filepath}.tmp"
+        with open(tmp, "w") as file:
+            file.write(self.render())
+        os.replace(tmp, filepath)
+
+
+REGISTRY = Registry()
+
+NGROK_STARTS = REGISTRY.register(
+    Counter("nctl_ngrok_starts_total", "Number of times the ngrok process was started.")
+)
+NGROK_LINES = REGISTRY.register(
+    Counter("nctl_ngrok_lines_total", "Lines of output from ngrok.", ("lvl",))
+)
+PUBLIC_URL_SECONDS = REGISTRY.register(
+    Gauge(
+        "nctl_public_url_seconds",
+        "Seconds from start until the first public URL was available.",
+        ("tunnel",),
+    )
+)
+PUBLIC_URL_CHANGES = REGISTRY.register(
+    Counter(
+        "nctl_public_url_changes_total",
+        "Number of public URL changes.",
+        ("tunnel",),
+    )
+)
+CLOUDFRONT_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_cloudfront_seconds",
+        "Latency of CloudFront operations.",
+        ("operation",),
+    )
+)
+CLOUDFRONT_ERRORS = REGISTRY.register(
+    Counter(
+        "nctl_cloudfront_errors_total",
+        "Failed CloudFront operations.",
+        ("operation", "error"),
+    )
+)
+CLOUDFRONT_RETRIES = REGISTRY.register(
+    Counter(
+        "nctl_cloudfront_retries_total",
+        "Retried CloudFront requests.",
+        ("reason",),
+    )
+)
+CLOUDFRONT_UPDATES = REGISTRY.register(
+    Counter(
+        "nctl_cloudfront_updates_total",
+        "Distribution updates by result.",
+        ("result",),
+    )
+)
+DEPLOY_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_cloudfront_deploy_seconds",
+        "Seconds from an update until the distribution was deployed.",
+    )
+)
+JOB_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_job_wait_seconds",
+        "Seconds a distribution update waited for the debounce and the concurrency limit.",
+        ("tunnel",),
+    )
+)
+JOB_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_job_seconds",
+        "Seconds spent updating the distribution, until the update was accepted.",
+        ("tunnel",),
+    )
+)
+JOB_DEPLOYED_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_job_deployed_seconds",
+        "Seconds from the start of a distribution update until CloudFront was serving the public URL.",
+        ("tunnel",),
+    )
+)
+JOB_COALESCED = REGISTRY.register(
+    Counter(
+        "nctl_job_coalesced_total",
+        "Public URLs that were superseded by a newer one before their update started.",
+        ("tunnel",),
+    )
+)
+PROBE_SECONDS = REGISTRY.register(
+    Histogram(
+        "nctl_probe_seconds",
+        "Latency of the origin health probes.",
+        ("probe",),
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    )
+)
+PROBE_FAILURES = REGISTRY.register(
+    Counter(
+        "nctl_probe_failures_total",
+        "Failed origin health probes.",
+        ("probe", "reason"),
+    )
+)
+PARSE_CACHE = REGISTRY.register(
+    Counter(
+        "nctl_parse_cache_total",
+        "Lookups in the parse cache for YAML files.",
+        ("result",),
+    )
+)
+
+
+def timed(operation: str) -> Callable:
+    """Decorator that records the latency and the failures of a CloudFront operation.
+
+    Args:
+        operation: Name of the operation.
+
+    Returns:
+        Callable:
+        Decorator for the function.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                CLOUDFRONT_ERRORS.inc(operation=operation, error=type(error).__name__)
+                raise
+            finally:
+                CLOUDFRONT_SECONDS.observe(
+                    time.perf_counter() - start, operation=operation
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Request handler that serves the registry on ``/metrics``"""
+
+    registry: Registry = REGISTRY
+
+    def do_GET(self) -> None:
+        """Responds with the exposition text."""
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """Routes the access logs to debug level, so scrapes don't flood the logs."""
+        LOGGER.debug("metrics: " + format, *args)
+
+
+def serve(
+    host: str, port: int, registry: Registry = REGISTRY
+) -> http.server.ThreadingHTTPServer:
+    """Serves the registry on ``http://host:port/metrics`` from a daemon thread.
+
+    Args:
+        host: Interface to bind to.
+        port: Port to listen on.
+        registry: Registry to serve.
+
+    Returns:
+        ThreadingHTTPServer:
+        Running server, that can be stopped with ``shutdown()``
+    """
+    handler = type("Handler", (_Handler,), {"registry": registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    LOGGER.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return server
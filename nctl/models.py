@@ -1,21 +1,47 @@
-import multiprocessing
+import functools
 import pathlib
 import socket
+import threading
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
-from pydantic import BaseModel, FilePath, PositiveInt
+from pydantic import (
+    BaseModel,
+    Field,
+    FilePath,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
+    model_validator,
+)
 from pydantic_settings import BaseSettings
 
 
+@functools.cache
+def localhost() -> str:
+    """Resolves the localhost address once, only when the host is not provided.
+
+    Returns:
+        str:
+        IP address of localhost.
+    """
+    return socket.gethostbyname("localhost") or "0.0.0.0"
+
+
 class Concurrency(BaseModel):
-    """BaseModel to load the multiprocessing object reference.
+    """BaseModel to load the worker thread references, the current public URLs and the state of the ngrok process.
 
     >>> Concurrency
 
     """
 
-    cloudfront_process: multiprocessing.Process | None = None
+    workers: Dict[str, threading.Thread] = {}
+    public_urls: Dict[str, str] = {}
+    started: float = 0.0
+    semaphore: threading.BoundedSemaphore | None = None
+    supervisor: Any = None
+    restart: threading.Event = Field(default_factory=threading.Event)
 
     class Config:
         """Config to allow arbitrary types."""
@@ -34,6 +60,59 @@ class LogOptions(Enum):
     file: str = "file"
 
 
+class LogFormatOptions(Enum):
+    """Enum for log format options.
+
+    >>> LogFormatOptions
+
+    """
+
+    text: str = "text"
+    json: str = "json"
+
+
+class OverflowOptions(Enum):
+    """Enum for the overflow policy of the logging queue.
+
+    >>> OverflowOptions
+
+    """
+
+    drop: str = "drop"
+    block: str = "block"
+
+
+class DiscoveryOptions(Enum):
+    """Enum for public URL discovery options.
+
+    >>> DiscoveryOptions
+
+    """
+
+    stdout: str = "stdout"
+    api: str = "api"
+
+
+class Tunnel(BaseModel):
+    """BaseModel object for a tunnel to distribution mapping.
+
+    >>> Tunnel
+
+    """
+
+    name: str = Field(pattern=r"^[\w-]+$")
+    port: PositiveInt
+    host: str | None = None
+    distribution_id: str | None = None
+    distribution_config: FilePath | None = None
+    distribution_ids: List[str] = []
+
+    class Config:
+        """Config to make the mappings immutable, since they are shared by the settings snapshot."""
+
+        frozen = True
+
+
 class EnvConfig(BaseSettings):
     """Configuration settings for environment variables.
 
@@ -42,39 +121,137 @@ class EnvConfig(BaseSettings):
     """
 
     # Tunnel config
-    port: PositiveInt
-    host: str = socket.gethostbyname("localhost") or "0.0.0.0"
+    port: PositiveInt | None = None
+    host: str = Field(default_factory=localhost)
+    tunnels: List[Tunnel] = []
+    max_parallel: PositiveInt = 4
 
     # Ngrok config
     ngrok_auth: str | None = None
     ngrok_config: FilePath | None = None
 
+    # Health check config
+    health_check: bool = False
+    health_path: str = "/"
+    health_status: PositiveInt = 200
+    health_public: bool = False
+    health_successes: PositiveInt = 3
+    health_interval: PositiveFloat = 1
+    health_timeout: PositiveFloat = 300
+    health_probe_timeout: PositiveFloat = 2
+
+    # Reload config
+    reload: bool = False
+    reload_interval: PositiveFloat = 1
+
+    # Restart config
+    restart: bool = False
+    restart_initial_delay: PositiveFloat = 1
+    restart_max_delay: PositiveFloat = 60
+    restart_backoff: float = Field(2.0, ge=1)
+    restart_max_failures: PositiveInt = 5
+    restart_window: PositiveFloat = 60
+
+    # Discovery config
+    discovery: DiscoveryOptions = DiscoveryOptions.stdout
+    agent_api: str = "http://127.0.0.1:4040"
+    discovery_interval: PositiveFloat = 0.05
+    discovery_max_interval: PositiveFloat = 2.0
+    discovery_backoff: float = Field(2.0, ge=1)
+    discovery_timeout: PositiveFloat = 60
+
     # AWS config
     aws_profile_name: str | None = None
     aws_access_key_id: str | None = None
     aws_secret_access_key: str | None = None
     aws_default_region: str | None = None
+    aws_credential_cache: str | None = "~/.nctl/credentials"
     distribution_id: str | None = None
     distribution_config: FilePath | None = None
+    distribution_ids: List[str] = []
     configdir: str = "cloudfront_config"
+    api_rate_limit: PositiveFloat = 5
+    url_debounce: NonNegativeFloat = 1
+    deploy_initial_delay: PositiveFloat = 5
+    deploy_max_delay: PositiveFloat = 60
+    deploy_backoff: float = Field(2.0, ge=1)
+    deploy_timeout: PositiveFloat = 900
+
+    # Metrics config
+    metrics_port: PositiveInt | None = None
+    metrics_host: str = "127.0.0.1"
+    metrics_file: str | None = None
+
+    # Profiling config
+    profile: bool = False
+    trace_memory: bool = False
+    trace_memory_frames: PositiveInt = 10
+    profile_dir: str = "profiles"
+    profile_top: PositiveInt = 25
 
     # Logging config
     debug: bool = False
     log: LogOptions = LogOptions.stdout
     log_config: Dict[str, Any] | FilePath | None = None
+    log_format: LogFormatOptions = LogFormatOptions.text
+    log_queue: bool = False
+    log_queue_size: PositiveInt = 10_000
+    log_overflow: OverflowOptions = OverflowOptions.drop
+    log_max_bytes: NonNegativeInt = 0
+    log_rotate_midnight: bool = False
+    log_backup_count: PositiveInt = 7
+    log_compress: bool = True
+
+    @model_validator(mode="after")
+    def validate_tunnels(self) -> "EnvConfig":
+        """Validates that either a port or a list of tunnels is provided, with unique names."""
+        if not (self.port or self.tunnels):
+            raise ValueError("Any one of 'port' or 'tunnels' is required")
+        names = [tunnel.name for tunnel in self.tunnels]
+        if len(names) != len(set(names)):
+            raise ValueError("Tunnel names must be unique")
+        return self
+
+    def mappings(self) -> List[Tunnel]:
+        """Returns the tunnel to distribution mappings.
+
+        See Also:
+            When ``tunnels`` is not set, the top level ``port`` and ``distribution_*`` settings form a single mapping,
+            named after ngrok's default tunnel name ``command_line``.
+
+        Returns:
+            List[Tunnel]:
+            List of tunnels with the host resolved.
+        """
+        if not self.tunnels:
+            return [
+                Tunnel(
+                    name="command_line",
+                    port=self.port,
+                    host=self.host,
+                    distribution_id=self.distribution_id,
+                    distribution_config=self.distribution_config,
+                    distribution_ids=self.distribution_ids,
+                )
+            ]
+        return [
+            tunnel if tunnel.host else tunnel.model_copy(update={"host": self.host})
+            for tunnel in self.tunnels
+        ]
 
     @classmethod
-    def from_env_file(cls, env_file: pathlib.Path) -> "EnvConfig":
+    def from_env_file(cls, env_file: pathlib.Path, **kwargs) -> "EnvConfig":
         """Create Settings instance from environment file.
 
         Args:
             env_file: Name of the env file.
+            kwargs: Values that take priority over the ones in the env file.
 
         Returns:
             EnvConfig:
             Loads the ``EnvConfig`` model.
         """
-        return cls(_env_file=env_file)
+        return cls(_env_file=env_file, **kwargs)
 
     class Config:
         """Extra configuration for EnvConfig object."""
@@ -83,5 +260,104 @@ class EnvConfig(BaseSettings):
         hide_input_in_errors = True
 
 
+class Settings:
+    """Immutable snapshot of a validated ``EnvConfig``
+
+    >>> Settings
+
+    See Also:
+        - Built once after validation, and handed to the workers as is, so the config is never validated again.
+        - Attributes are stored in ``__slots__`` and lists are frozen as tuples, so a snapshot can't be changed
+          in place. Use ``replace`` to derive a new one, and swap ``models.env`` to apply it.
+        - Pickles as a plain tuple of values, without going through pydantic.
+    """
+
+    __slots__ = (*EnvConfig.model_fields, "_mappings")
+    fields = tuple(EnvConfig.model_fields)
+    # excluded from the repr
+    secrets = ("ngrok_auth", "aws_access_key_id", "aws_secret_access_key")
+
+    def __init__(self, config: EnvConfig):
+        """Takes the snapshot of the validated config.
+
+        Args:
+            config: Validated environment config.
+        """
+        self._assign({name: getattr(config, name) for name in self.fields})
+
+    def _assign(
+        self, values: Dict[str, Any], mappings: Tuple[Tunnel, ...] | None = None
+    ) -> None:
+        """Stores the values, and resolves the mappings unless they are known."""
+        for name, value in values.items():
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, name, value)
+        if mappings is None:
+            mappings = tuple(EnvConfig.mappings(self))
+        object.__setattr__(self, "_mappings", mappings)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Rejects any change in place."""
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace()")
+
+    def __delattr__(self, name: str) -> None:
+        """Rejects any change in place."""
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace()")
+
+    def __getstate__(self) -> tuple:
+        """Serializes the values in the order of the fields, and the resolved mappings."""
+        return tuple(getattr(self, name) for name in self.fields), self._mappings
+
+    def __setstate__(self, state: tuple) -> None:
+        """Restores the values, without validating them again."""
+        values, mappings = state
+        self._assign(dict(zip(self.fields, values)), mappings)
+
+    def __eq__(self, other: Any) -> bool:
+        """Compares the values of the fields."""
+        if not isinstance(other, Settings):
+            return NotImplemented
+        return self.__getstate__()[0] == other.__getstate__()[0]
+
+    # compared by value, but the fields hold lists and dicts, so there is no hash consistent with equality
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        """Renders the fields, with the secrets masked."""
+        values = ", ".join(
+            f"{name}={'***' if name in self.secrets and getattr(self, name) else repr(getattr(self, name))}"
+            for name in self.fields
+        )
+        return f"{type(self).__name__}({values})"
+
+    def replace(self, **changes: Any) -> "Settings":
+        """Derives a new snapshot with some of the values changed.
+
+        Args:
+            changes: Field names and the new values, which are trusted as validated.
+
+        Returns:
+            Settings:
+            New snapshot, the current one is left unchanged.
+        """
+        if unknown := set(changes) - set(self.fields):
+            raise AttributeError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        settings = object.__new__(type(self))
+        settings._assign(
+            {name: changes.get(name, getattr(self, name)) for name in self.fields}
+        )
+        return settings
+
+    def mappings(self) -> List[Tunnel]:
+        """Returns the tunnel to distribution mappings, resolved when the snapshot was taken.
+
+        Returns:
+            List[Tunnel]:
+            List of tunnels with the host resolved.
+        """
+        return list(self._mappings)
+
+
 concurrency = Concurrency()
-env: EnvConfig | None = None
+env: Settings | None = None
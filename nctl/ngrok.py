@@ -1,92 +1,418 @@
+import asyncio
 import logging
-import multiprocessing
-import subprocess
-from typing import Any, Dict
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
 
-from nctl import aws, logger, models, squire
+from nctl import agent, aws, logfmt, logger, metrics, models, profiler, squire
+from nctl.supervisor import RestartPolicy, Supervisor
+from nctl.watcher import FileWatcher
+from nctl.worker import Worker
 
 LOGGER = logging.getLogger("nctl.tunnel")
+TUNNELS_CONFIG = "nctl_tunnels.yml"
+LEVELS = {
+    "info": LOGGER.info,
+    "warn": LOGGER.warning,
+    "err": LOGGER.error,
+    "error": LOGGER.error,
+}
+# line counter and logging method for each ngrok level, resolved once per level
+ROUTES: Dict[str | None, Tuple[Callable[[], None], Callable | None]] = {}
+RELOAD_LOGGING = {
+    "debug",
+    "log",
+    "log_config",
+    "log_format",
+    "log_queue",
+    "log_queue_size",
+    "log_overflow",
+    "log_max_bytes",
+    "log_rotate_midnight",
+    "log_backup_count",
+    "log_compress",
+}
+RELOAD_AWS = {
+    "aws_profile_name",
+    "aws_access_key_id",
+    "aws_secret_access_key",
+    "aws_default_region",
+    "aws_credential_cache",
+}
+RELOAD_NGROK = {"ngrok_auth", "ngrok_config", "discovery", "agent_api"}
+RELOAD_UNSUPPORTED = {
+    "max_parallel",
+    "metrics_port",
+    "metrics_host",
+    "profile",
+    "trace_memory",
+    "trace_memory_frames",
+    "profile_dir",
+    "profile_top",
+    "reload",
+    "reload_interval",
+    "restart",
+    "restart_initial_delay",
+    "restart_max_delay",
+    "restart_backoff",
+    "restart_max_failures",
+    "restart_window",
+}
 
 
-# Have this as a dedicated function to avoid pickling error
-def distribution_handler(public_url: str, env_dump: Dict[str, Any]) -> None:
-    """Updates the cloudfront distribution in a dedicated process.
+def publish(name: str | None, public_url: str) -> None:
+    """Hands over the public URL to the tunnel's long-lived worker, whenever it changes.
+
+    See Also:
+        The worker coalesces bursts of changes, so only the latest URL is sent to CloudFront.
 
     Args:
+        name: Name of the tunnel, as reported by ngrok.
         public_url: Public URL from ngrok, that has to be updated.
-        env_dump: JSON dump of environment variables' configuration.
     """
-    cloud_front = aws.CloudFront(env_dump)
-    cloud_front.run(public_url)
+    workers = models.concurrency.workers
+    if len(workers) == 1:
+        # a single tunnel is always the one reporting the URL, regardless of how ngrok names it
+        worker = next(iter(workers.values()))
+    elif not (worker := workers.get(name)):
+        LOGGER.warning("No distribution mapped to the tunnel %r", name)
+        return
+    if public_url == models.concurrency.public_urls.get(worker.tunnel.name):
+        return
+    if worker.tunnel.name not in models.concurrency.public_urls:
+        metrics.PUBLIC_URL_SECONDS.set(
+            time.monotonic() - models.concurrency.started, tunnel=worker.tunnel.name
+        )
+    metrics.PUBLIC_URL_CHANGES.inc(tunnel=worker.tunnel.name)
+    models.concurrency.public_urls[worker.tunnel.name] = public_url
+    LOGGER.info(
+        "Tunneling http://%s:%s through the public URL: %s",
+        worker.tunnel.host,
+        worker.tunnel.port,
+        public_url,
+    )
+    worker.submit(public_url)
 
 
-def writer(frame: str) -> None:
-    """Extracts the message part from each line into a custom message format.
+def discovery_handler(tunnel: models.Tunnel, stop: threading.Event) -> None:
+    """Polls ngrok's local agent API for the tunnel's public URL, and publishes it once available and on every change.
 
     Args:
-        frame: Each line of log message from ngrok.
+        tunnel: Tunnel to distribution mapping.
+        stop: Event to abort polling when the tunnel is closed.
     """
+    client = agent.AgentClient(models.env.agent_api)
+    # ngrok names the tunnel 'command_line' only when started without a config, so filter by name only for 'start'
+    name = tunnel.name if models.env.tunnels else None
+    start = time.monotonic()
     try:
-        level = frame.split("lvl=")[1].split()[0]
-    except IndexError:
-        print(frame)
-        return
-    if level == "info":
-        log = LOGGER.info
-    elif level == "warn":
-        log = LOGGER.warning
-    elif level in ("err", "error"):
-        log = LOGGER.error
-    else:
-        return
-    msg = frame.split("msg=")[-1].replace('"', "").replace("'", "")
-    if "url=" in msg and not models.concurrency.cloudfront_process:
-        public_url = msg.split("url=")[-1].strip()
-        LOGGER.info(
-            "Tunneling http://%s:%s through the public URL: %s",
-            models.env.host,
-            models.env.port,
-            public_url,
+        public_url = agent.discover(
+            client=client,
+            interval=models.env.discovery_interval,
+            max_interval=models.env.discovery_max_interval,
+            factor=models.env.discovery_backoff,
+            timeout=models.env.discovery_timeout,
+            stop=stop,
+            name=name,
         )
-        process = multiprocessing.Process(
-            target=distribution_handler, args=(public_url, models.env.model_dump())
+        if not public_url:
+            return
+        LOGGER.debug("Public URL discovered in %.3fs", time.monotonic() - start)
+        publish(tunnel.name, public_url)
+        # ngrok gets a new public URL when it reconnects, so the agent API is polled until the tunnel is closed
+        for public_url in agent.watch(
+            client=client,
+            public_url=public_url,
+            interval=models.env.discovery_max_interval,
+            stop=stop,
+            name=name,
+        ):
+            publish(tunnel.name, public_url)
+    finally:
+        client.close()
+
+
+def writer(frame: logfmt.Frame) -> None:
+    """Logs a parsed ngrok frame and triggers the distribution update when the public URL is available.
+
+    Args:
+        frame: Parsed frame of a single line of log message from ngrok.
+    """
+    if not (route := ROUTES.get(frame.lvl)):
+        route = ROUTES[frame.lvl] = (
+            metrics.NGROK_LINES.bind(lvl=frame.lvl or ""),
+            LEVELS.get(frame.lvl),
         )
-        process.name = "distribution-handler"
-        process.start()
-        models.concurrency.cloudfront_process = process
-    log(msg)
+    count, log = route
+    count()
+    if log is None:
+        if frame.lvl is None:
+            print(frame.raw.decode(errors="replace"))
+        return
+    # frames are parsed lazily, so only the lines with a public URL are parsed here, the rest when emitted
+    if (
+        b"url=" in frame.raw
+        and (frame := frame.resolve()).url
+        and models.env.discovery == models.DiscoveryOptions.stdout
+    ):
+        publish(frame.extra.get("name"), frame.url)
+    # the frame is the message, so that it is only rendered when emitted, and the JSON formatter can emit the fields
+    log(frame)
 
 
-def tunnel(**kwargs) -> None:
-    """Initiates a ngrok tunnel using the CLI and updates cloudfront distribution."""
-    models.env = squire.load_env(**kwargs)
-    logger.configure_logging(
-        debug=models.env.debug,
-        log_config=models.env.log_config,
-        process="tunnel",
-        log=models.env.log,
-    )
-    squire.run_validations()
+def build_command() -> List[str]:
+    """Builds the ngrok command for the current mappings.
 
+    Returns:
+        List[str]:
+        ngrok command and its arguments.
+    """
     # https://ngrok.com/docs/agent/config/
-    command = f'ngrok http {models.env.port} --log "stdout"'
-    if models.env.ngrok_config:
-        command += f" --config {models.env.ngrok_config}"
+    if models.env.tunnels:
+        # a single agent serves all the tunnels
+        squire.create_tunnels_config(models.env.mappings(), TUNNELS_CONFIG)
+        command = ["ngrok", "start", "--all", "--log", "stdout"]
+        command.extend(("--config", str(models.env.ngrok_config)))
+        command.extend(("--config", TUNNELS_CONFIG))
+    else:
+        command = ["ngrok", "http", str(models.env.port), "--log", "stdout"]
+        if models.env.ngrok_config:
+            command.extend(("--config", str(models.env.ngrok_config)))
+    return command
+
+
+def sync_workers() -> None:
+    """Starts a worker for every new mapping, stops the ones that were removed, and updates the rest in place."""
+    mappings = {mapping.name: mapping for mapping in models.env.mappings()}
+    for name in set(models.concurrency.workers) - set(mappings):
+        LOGGER.info("Stopping the worker for %r", name)
+        models.concurrency.workers.pop(name).stop(timeout=3)
+        models.concurrency.public_urls.pop(name, None)
+    for name, mapping in mappings.items():
+        if not (worker := models.concurrency.workers.get(name)):
+            worker = Worker(
+                tunnel=mapping,
+                semaphore=models.concurrency.semaphore,
+                debounce=models.env.url_debounce,
+            )
+            worker.start()
+            models.concurrency.workers[name] = worker
+            continue
+        previous, worker.tunnel = worker.tunnel, mapping
+        worker.debounce = models.env.url_debounce
+        if (previous.host, previous.port) != (mapping.host, mapping.port):
+            worker.reset_probe()
+        if worker.cloudfront:
+            worker.cloudfront.tunnel = mapping
+            # a distribution created at runtime has no ID in the config, so it is retained
+            if mapping.distribution_id:
+                worker.cloudfront.distribution_id = mapping.distribution_id
+        if (
+            previous.distribution_id != mapping.distribution_id
+            or previous.distribution_ids != mapping.distribution_ids
+        ) and (public_url := models.concurrency.public_urls.get(name)):
+            LOGGER.info("Distributions for %r have changed, updating the origin", name)
+            worker.submit(public_url)
 
-    process = subprocess.Popen(
-        command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+
+def supervise() -> None:
+    """Runs ngrok until interrupted, restarting it with backoff when the restart policy is enabled.
+
+    See Also:
+        - The workers outlive the ngrok process, so a restart only triggers an update when the public URL changes.
+        - A restart requested by a config reload happens right away, and doesn't count as a crash.
+    """
+    policy = (
+        RestartPolicy(
+            initial_delay=models.env.restart_initial_delay,
+            max_delay=models.env.restart_max_delay,
+            factor=models.env.restart_backoff,
+            max_failures=models.env.restart_max_failures,
+            window=models.env.restart_window,
+        )
+        if models.env.restart
+        else None
     )
     while True:
+        supervisor = Supervisor(command=build_command(), handlers=[writer], lazy=True)
+        models.concurrency.supervisor = supervisor
+        stop = threading.Event()
+        if models.env.discovery == models.DiscoveryOptions.api:
+            for mapping in models.env.mappings():
+                threading.Thread(
+                    target=discovery_handler,
+                    args=(mapping, stop),
+                    name=f"discovery-{mapping.name}",
+                    daemon=True,
+                ).start()
+        models.concurrency.started = time.monotonic()
+        metrics.NGROK_STARTS.inc()
         try:
-            output = process.stdout.readline().decode().strip()
-            if process.poll() and not output:
-                break
-            writer(output)
+            returncode = asyncio.run(supervisor.run())
         except KeyboardInterrupt:
+            # signal handlers are unavailable on Windows, so the interrupt surfaces here instead
             LOGGER.warning("Tunneling interrupted")
-            if models.concurrency.cloudfront_process:
-                models.concurrency.cloudfront_process.join(timeout=3)
-                models.concurrency.cloudfront_process.terminate()
-            break
-    process.kill()
+            return
+        finally:
+            stop.set()
+        if models.concurrency.restart.is_set():
+            models.concurrency.restart.clear()
+            LOGGER.info("Restarting ngrok with the new settings")
+            continue
+        if supervisor.stopped or not policy:
+            return
+        uptime = time.monotonic() - models.concurrency.started
+        if (delay := policy.next_delay(uptime)) is None:
+            LOGGER.error(
+                "ngrok exited %d times within %ss, giving up",
+                policy.max_failures,
+                policy.window,
+            )
+            return
+        LOGGER.warning(
+            "ngrok exited with code %s after %.1fs, restarting in %.1fs",
+            returncode,
+            uptime,
+            delay,
+        )
+        try:
+            time.sleep(delay)
+        except KeyboardInterrupt:
+            LOGGER.warning("Tunneling interrupted")
+            return
+
+
+def watched_files(**kwargs) -> List[str]:
+    """Lists the files that affect the running config.
+
+    Returns:
+        List[str]:
+        Paths of the env file, the ngrok config, the log config and the distribution templates.
+    """
+    files = [kwargs.get("env_file") or (".env" if os.path.isfile(".env") else None)]
+    files.append(models.env.ngrok_config)
+    if models.env.log_config and not isinstance(models.env.log_config, dict):
+        files.append(models.env.log_config)
+    files.extend(mapping.distribution_config for mapping in models.env.mappings())
+    return [str(file) for file in files if file]
+
+
+def reload(changed: List[str], watcher: FileWatcher | None = None, **kwargs) -> None:
+    """Re-validates the config after a file change, and applies only the affected parts.
+
+    See Also:
+        - Logging is re-attached when the log settings or the log config file change.
+        - The CloudFront client is re-created when the AWS credentials change.
+        - ngrok is restarted only when its own settings change, since that results in a new public URL.
+        - Mappings are synced with the workers, and everything else is read from the env config when used.
+
+    Args:
+        changed: Files whose content has changed.
+        watcher: File watcher, to watch the files from the new config.
+    """
+    previous = models.env
+    try:
+        # the new snapshot is swapped in only once it is valid, so the workers never see a partial config
+        models.env = squire.run_validations(squire.load_env(**kwargs))
+    except (AssertionError, ValueError) as error:
+        # pydantic's ValidationError is a ValueError
+        LOGGER.error(
+            "Ignoring the invalid config, the current one is retained: %s", error
+        )
+        return
+    fields = {
+        name
+        for name in models.Settings.fields
+        if getattr(previous, name) != getattr(models.env, name)
+    }
+    changed = {os.path.abspath(path) for path in changed}
+
+    def touched(filepath: Any) -> bool:
+        return bool(filepath) and os.path.abspath(str(filepath)) in changed
+
+    if fields:
+        LOGGER.info("Settings changed: %s", ", ".join(sorted(fields)))
+    if fields & RELOAD_LOGGING or (
+        not isinstance(models.env.log_config, dict) and touched(models.env.log_config)
+    ):
+        for process in ("tunnel", "cloudfront"):
+            logger.reset(process)
+        logger.configure_env()
+        LOGGER.info("Logging has been reconfigured")
+    if fields & RELOAD_AWS:
+        aws.reset_client()
+        for worker in models.concurrency.workers.values():
+            if worker.cloudfront:
+                worker.cloudfront.client = aws.shared_client()
+        LOGGER.info("CloudFront client has been re-created")
+    for mapping in models.env.mappings():
+        if touched(mapping.distribution_config):
+            LOGGER.info(
+                "Distribution template %s will be used when the distribution is created",
+                mapping.distribution_config,
+            )
+    sync_workers()
+    if pending := fields & RELOAD_UNSUPPORTED:
+        LOGGER.warning(
+            "Restart nctl to apply the changes to: %s", ", ".join(sorted(pending))
+        )
+    tunnels = [(m.name, m.host, m.port) for m in models.env.mappings()]
+    if (
+        tunnels != [(m.name, m.host, m.port) for m in previous.mappings()]
+        or fields & RELOAD_NGROK
+        or touched(models.env.ngrok_config)
+    ):
+        LOGGER.warning("ngrok settings changed, restarting the tunnel")
+        models.concurrency.restart.set()
+        if models.concurrency.supervisor:
+            models.concurrency.supervisor.request_stop()
+    if watcher:
+        watcher.watch(watched_files(**kwargs))
+
+
+def tunnel(**kwargs) -> None:
+    """Initiates a ngrok tunnel using the CLI and updates cloudfront distribution."""
+    models.env = squire.load_env(**kwargs)
+    logger.configure_env()
+    profile = profiler.start(
+        directory=models.env.profile_dir,
+        label="tunnel",
+        cpu=models.env.profile,
+        memory=models.env.trace_memory,
+        frames=models.env.trace_memory_frames,
+        top=models.env.profile_top,
+    )
+    models.env = squire.run_validations(models.env)
+
+    # start the workers ahead of the tunnel, so the CloudFront client is warm by the time the public URL is available
+    models.concurrency.semaphore = threading.BoundedSemaphore(models.env.max_parallel)
+    sync_workers()
+
+    if models.env.metrics_port:
+        server = metrics.serve(models.env.metrics_host, models.env.metrics_port)
+    else:
+        server = None
+    if models.env.reload:
+        watcher = FileWatcher(
+            paths=watched_files(**kwargs),
+            callback=lambda changed: reload(changed, watcher, **kwargs),
+            interval=models.env.reload_interval,
+        )
+        watcher.start()
+    else:
+        watcher = None
+    supervise()
+    if watcher:
+        watcher.stop()
+    for worker in models.concurrency.workers.values():
+        worker.stop(timeout=3)
     LOGGER.warning("Connection closed")
+    if server:
+        server.shutdown()
+    if models.env.metrics_file:
+        metrics.REGISTRY.dump(models.env.metrics_file)
+        LOGGER.info("Metrics dumped to %s", models.env.metrics_file)
+    if profile:
+        profile.stop()
+    logger.shutdown()
@@ -0,0 +1,216 @@
+import atexit
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Tuple
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+# since 3.12 cProfile is built on sys.monitoring, so a single profiler sees every thread
+PER_THREAD = sys.version_info < (3, 12)
+
+
+class _Snapshot:
+    """Adapter that lets ``pstats`` read a running profile, without disabling it."""
+
+    def __init__(self, profile: cProfile.Profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self) -> None:
+        """Stats are already snapshotted."""
+
+
+class Profiler:
+    """Collects CPU profiles from every thread and the top allocation sites, and stores them as stats files.
+
+    >>> Profiler
+
+    See Also:
+        - Before 3.12, cProfile only sees the thread it was enabled on, so every new thread enables its own
+          profile through ``threading.setprofile``, and the profiles are merged when dumped.
+        - Files are named after the process label, PID and timestamp, so concurrent nctl processes don't collide.
+        - ``SIGUSR1`` dumps the stats without stopping, eg: ``kill -USR1 <pid>`` while nctl is under load.
+        - Nothing is installed unless ``cpu`` or ``memory`` is set, so there is no overhead when disabled.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        label: str,
+        cpu: bool = True,
+        memory: bool = False,
+        frames: int = 10,
+        top: int = 25,
+    ):
+        """Instantiates the profiler.
+
+        Args:
+            directory: Directory to store the stats files.
+            label: Name of the process, used as the prefix of the stats files.
+            cpu: Boolean flag to collect CPU profiles with cProfile.
+            memory: Boolean flag to trace memory allocations with tracemalloc.
+            frames: Number of frames to store per allocation traceback.
+            top: Number of hot functions and allocation sites in the summary.
+        """
+        self.directory = directory
+        self.label = label
+        self.cpu = cpu
+        self.memory = memory
+        self.frames = frames
+        self.top = top
+        self.profiles: List[Tuple[threading.Thread, cProfile.Profile]] = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _enable(self, *_) -> None:
+        """Enables a profile for the current thread, also the entry point for ``threading.setprofile``"""
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append((threading.current_thread(), profile))
+        profile.enable()
+
+    def start(self) -> None:
+        """Starts collecting, and installs the ``SIGUSR1`` handler and the exit hook."""
+        if self._started or not (self.cpu or self.memory):
+            return
+        self._started = True
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory:
+            tracemalloc.start(self.frames)
+        if self.cpu:
+            if PER_THREAD:
+                threading.setprofile(self._enable)
+            self._enable()
+        if (
+            hasattr(signal, "SIGUSR1")
+            and threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGUSR1, self._signal)
+        atexit.register(self.stop)
+        LOGGER.info(
+            "Profiling %s with %s, send SIGUSR1 to %d to dump the stats",
+            self.label,
+            " and ".join(
+                name
+                for name, on in (("cProfile", self.cpu), ("tracemalloc", self.memory))
+                if on
+            ),
+            os.getpid(),
+        )
+
+    def _signal(self, *_) -> None:
+        """Dumps on a separate thread, since the signal may interrupt the main thread while it holds a lock."""
+        threading.Thread(
+            target=self.dump, args=("signal",), name="profile-dump", daemon=True
+        ).start()
+
+    def dump(self, reason: str = "shutdown") -> str | None:
+        """Stores the merged CPU profile, the memory snapshot and a text summary of both.
+
+        Args:
+            reason: Reason for the dump, included in the summary.
+
+        Returns:
+            str:
+            Filepath of the summary, or ``None`` if nothing is being collected.
+        """
+        if not self._started:
+            return
+        with self._lock:
+            profiles = list(self.profiles)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            prefix = os.path.join(self.directory, f"{self.label}-{os.getpid()}-{stamp}")
+            summary = io.StringIO()
+            summary.write(
+                f"nctl {self.label} [pid {os.getpid()}] profiled until {reason}\n\n"
+            )
+            # the memory snapshot is taken first, so that it doesn't include the merged CPU stats
+            if self.memory and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    (
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, cProfile.__file__),
+                        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                        tracemalloc.Filter(False, "<unknown>"),
+                    )
+                )
+            else:
+                snapshot = None
+            # threads that haven't made a call yet have nothing to merge
+            snapshots = [
+                (thread, stats)
+                for thread, profile in profiles
+                if self.cpu and (stats := _Snapshot(profile)).stats
+            ]
+            if snapshots:
+                stats = pstats.Stats(snapshots[0][1], stream=summary)
+                for _, other in snapshots[1:]:
+                    stats.add(other)
+                stats.dump_stats(f"{prefix}.prof")
+                summary.write(
+                    f"Threads: {', '.join(sorted({thread.name for thread, _ in snapshots}))}\n"
+                )
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+                stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+            if snapshot:
+                snapshot.dump(f"{prefix}.heap")
+                current, peak = tracemalloc.get_traced_memory()
+                summary.write(
+                    f"Traced memory: {current / 1024:,.1f} KiB current, {peak / 1024:,.1f} KiB peak\n"
+                    f"Top {self.top} allocation sites:\n"
+                )
+                for statistic in snapshot.statistics("lineno")[: self.top]:
+                    summary.write(f"  {statistic}\n")
+            with open(f"{prefix}.txt", "w") as file:
+                file.write(summary.getvalue())
+        LOGGER.info("Profile stats stored in %s.*", prefix)
+        return f"{prefix}.txt"
+
+    def stop(self) -> None:
+        """Dumps the stats one last time and stops collecting."""
+        if not self._started:
+            return
+        self.dump()
+        self._started = False
+        if self.cpu:
+            threading.setprofile(None)
+            current = threading.current_thread()
+            for thread, profile in self.profiles:
+                # only the profile of the current thread can be disabled, the others are discarded with the threads
+                if thread is current or not PER_THREAD:
+                    profile.disable()
+        if self.memory:
+            tracemalloc.stop()
+        atexit.unregister(self.stop)
+
+
+def start(
+    directory: str, label: str, cpu: bool, memory: bool, **kwargs
+) -> Profiler | None:
+    """Starts a profiler for the current process, when either ``cpu`` or ``memory`` is set.
+
+    Args:
+        directory: Directory to store the stats files.
+        label: Name of the process, used as the prefix of the stats files.
+        cpu: Boolean flag to collect CPU profiles with cProfile.
+        memory: Boolean flag to trace memory allocations with tracemalloc.
+
+    Returns:
+        Profiler:
+        Running profiler, or ``None`` when profiling is disabled.
+    """
+    if not (cpu or memory):
+        return
+    profiler = Profiler(
+        directory=directory, label=label, cpu=cpu, memory=memory, **kwargs
+    )
+    profiler.start()
+    return profiler
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple
+
+LOGGER = logging.getLogger("nctl.cloudfront")
+
+
+class Snapshot(NamedTuple):
+    """Entry in the snapshot history of a distribution.
+
+    >>> Snapshot
+
+    """
+
+    id: str
+    created: str
+    etag: str | None = None
+
+    def __str__(self) -> str:
+        """Renders the snapshot as ``id created etag``"""
+        return f"{self.id[:12]}  {self.created}  {self.etag or '-'}"
+
+
+def _canonical(data: Any) -> bytes:
+    """Serializes the data in a canonical form, so that equal data always hashes the same."""
+    return json.dumps(
+        data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode()
+
+
+def _write(filepath: str, content: bytes) -> None:
+    """Writes a file atomically, with a temp file and a rename."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp = f"{filepath}.tmp"
+    with open(tmp, "wb") as file:
+        file.write(content)
+    os.replace(tmp, filepath)
+
+
+class SnapshotStore:
+    """Content-addressed history of a distribution's config.
+
+    >>> SnapshotStore
+
+    See Also:
+        - Each top-level section of the config is stored once as an object, named after the SHA-256 of its content.
+        - A snapshot is a manifest of section names to object hashes, so a new version only writes the changed
+          sections, eg: an origin change rewrites ``Origins`` and ``DefaultCacheBehavior`` but not ``CacheBehaviors``
+        - The snapshot ID is the hash of its manifest, so identical configs share the same ID.
+    """
+
+    def __init__(self, configdir: str, distribution_id: str):
+        """Instantiates the store for a distribution.
+
+        Args:
+            configdir: Directory where the snapshots are stored.
+            distribution_id: Distribution ID.
+        """
+        self.directory = os.path.join(configdir, "snapshots", distribution_id)
+        self.index = os.path.join(self.directory, "index.json")
+
+    def _object(self, digest: str) -> str:
+        """Returns the path of an object, fanned out by the first two characters of the hash."""
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.json")
+
+    def _put(self, data: Any) -> str:
+        """Stores the data as an object, unless it already exists.
+
+        Returns:
+            str:
+            Hash of the object.
+        """
+        content = _canonical(data)
+        digest = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(filepath := self._object(digest)):
+            _write(filepath, content)
+        return digest
+
+    def _get(self, digest: str) -> Any:
+        """Loads an object by its hash."""
+        with open(self._object(digest), "rb") as file:
+            return json.load(file)
+
+    def list(self) -> List[Snapshot]:
+        """Lists the snapshots of the distribution.
+
+        Returns:
+            List[Snapshot]:
+            Snapshots in the order they were taken, oldest first.
+        """
+        try:
+            with open(self.index) as file:
+                return [Snapshot(*entry) for entry in json.load(file)]
+        except FileNotFoundError:
+            return []
+
+    def save(
+        self, distribution_config: Dict[str, Any], etag: str | None = None
+    ) -> Snapshot:
+        """Takes a snapshot of the distribution config.
+
+        Args:
+            distribution_config: Distribution config, as in ``DistributionConfig``
+            etag: ETag of the distribution, when the snapshot was taken.
+
+        Returns:
+            Snapshot:
+            New snapshot, or the latest one if the config hasn't changed.
+        """
+        manifest = {key: self._put(value) for key, value in distribution_config.items()}
+        snapshot_id = self._put(manifest)
+        snapshots = self.list()
+        if snapshots and snapshots[-1].id == snapshot_id:
+            LOGGER.debug("Snapshot %s is unchanged", snapshot_id[:12])
+            return snapshots[-1]
+        snapshot = Snapshot(
+            id=snapshot_id,
+            created=datetime.now().astimezone().isoformat(timespec="seconds"),
+            etag=etag,
+        )
+        snapshots.append(snapshot)
+        _write(self.index, json.dumps(snapshots, indent=2).encode())
+        LOGGER.info("Stored snapshot %s", snapshot.id[:12])
+        return snapshot
+
+    def resolve(self, snapshot_id: str) -> Snapshot:
+        """Finds a snapshot by its ID or a unique prefix of it.
+
+        Args:
+            snapshot_id: Full or abbreviated snapshot ID.
+
+        Returns:
+            Snapshot:
+            Matching snapshot.
+
+        Raises:
+            KeyError:
+            If the ID doesn't match exactly one snapshot.
+        """
+        matches = {
+            snapshot.id: snapshot
+            for snapshot in self.list()
+            if snapshot.id.startswith(snapshot_id)
+        }
+        if len(matches) != 1:
+            raise KeyError(
+                f"{snapshot_id!r} matches {len(matches)} snapshots in {self.directory!r}"
+            )
+        return matches.popitem()[1]
+
+    def load(self, snapshot_id: str) -> Dict[str, Any]:
+        """Restores the distribution config from a snapshot.
+
+        Args:
+            snapshot_id: Full or abbreviated snapshot ID.
+
+        Returns:
+            Dict[str, Any]:
+            Distribution config, as in ``DistributionConfig``
+        """
+        manifest = self._get(self.resolve(snapshot_id).id)
+        return {key: self._get(digest) for key, digest in manifest.items()}
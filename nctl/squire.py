@@ -3,10 +3,12 @@ import logging
 import os
 import pathlib
 import shutil
+from typing import List
 
 import yaml
 
 from nctl import models
+from nctl.cache import YAML_DUMPER, YAML_LOADER
 
 LOGGER = logging.getLogger("nctl.tunnel")
 
@@ -21,15 +23,40 @@ def create_ngrok_config(token: str, filename: str) -> None:
     config = {"version": "2", "authtoken": token}
     with open(filename, "w") as file:
         yaml.dump(
-            stream=file, data=config, Dumper=yaml.Dumper, default_flow_style=False
+            stream=file, data=config, Dumper=YAML_DUMPER, default_flow_style=False
         )
 
 
-def envfile_loader(filename: str | os.PathLike) -> models.EnvConfig:
+def create_tunnels_config(tunnels: List[models.Tunnel], filename: str) -> None:
+    """Creates a config file with the tunnel definitions for ngrok.
+
+    See Also:
+        - https://ngrok.com/docs/agent/config/v2/#tunnel-configurations
+        - This file is merged with the auth config, by passing multiple ``--config`` flags to ngrok.
+
+    Args:
+        tunnels: List of tunnel to distribution mappings.
+        filename: Filename to dump the config.
+    """
+    config = {
+        "version": "2",
+        "tunnels": {
+            tunnel.name: {"proto": "http", "addr": f"{tunnel.host}:{tunnel.port}"}
+            for tunnel in tunnels
+        },
+    }
+    with open(filename, "w") as file:
+        yaml.dump(
+            stream=file, data=config, Dumper=YAML_DUMPER, default_flow_style=False
+        )
+
+
+def envfile_loader(filename: str | os.PathLike, **kwargs) -> models.EnvConfig:
     """Loads environment variables based on filetypes.
 
     Args:
         filename: Filename from where env vars have to be loaded.
+        kwargs: Values that take priority over the ones in the file.
 
     Returns:
         EnvConfig:
@@ -40,41 +67,53 @@ def envfile_loader(filename: str | os.PathLike) -> models.EnvConfig:
     if sfx == ".json":
         with open(env_file) as stream:
             env_data = json.load(stream)
-        return models.EnvConfig(**{k.lower(): v for k, v in env_data.items()})
+        return models.EnvConfig(
+            **{**{k.lower(): v for k, v in env_data.items()}, **kwargs}
+        )
     if sfx in (".yaml", ".yml"):
+        # not cached, since configdir isn't known until the env file is loaded
         with open(env_file) as stream:
-            env_data = yaml.load(stream, yaml.FullLoader)
-        return models.EnvConfig(**{k.lower(): v for k, v in env_data.items()})
+            env_data = yaml.load(stream, Loader=YAML_LOADER) or {}
+        return models.EnvConfig(
+            **{**{k.lower(): v for k, v in env_data.items()}, **kwargs}
+        )
     if sfx in (".text", ".txt", ""):
-        return models.EnvConfig.from_env_file(env_file)
+        return models.EnvConfig.from_env_file(env_file, **kwargs)
     raise ValueError(
         "\n\tUnsupported format for 'env_file', can be one of (.json, .yaml, .yml, .txt, .text, or null)"
     )
 
 
-def load_env(**kwargs) -> models.EnvConfig:
+def load_env(**kwargs) -> models.Settings:
     """Merge env vars from env_file with kwargs, giving priority to kwargs.
 
     See Also:
-        This function allows env vars to be loaded partially from .env files and partially through kwargs.
+        - This function allows env vars to be loaded partially from .env files and partially through kwargs.
+        - The config is validated once, and frozen into a snapshot that is never validated again.
 
     Returns:
-        EnvConfig:
-        Returns a reference to the ``EnvConfig`` object.
+        Settings:
+        Returns an immutable snapshot of the ``EnvConfig`` object.
     """
     if env_file := kwargs.get("env_file"):
-        file_env = envfile_loader(env_file).model_dump()
+        config = envfile_loader(env_file, **kwargs)
     elif os.path.isfile(".env"):
-        file_env = envfile_loader(".env").model_dump()
+        config = envfile_loader(".env", **kwargs)
     else:
-        file_env = {}
-    merged_env = {**file_env, **kwargs}
-    return models.EnvConfig(**merged_env)
+        config = models.EnvConfig(**kwargs)
+    return models.Settings(config)
 
 
-def run_validations() -> None:
+def run_validations(env: models.Settings) -> models.Settings:
     """Validates the loaded environment variables and checks ngrok CLI availability.
 
+    Args:
+        env: Settings to validate.
+
+    Returns:
+        Settings:
+        Settings to use, with the ngrok config that was created from the auth token.
+
     Raises:
         AssertionError:
         If any of the validations fail.
@@ -82,19 +121,26 @@ def run_validations() -> None:
     assert shutil.which(
         cmd="ngrok"
     ), "\n\tTo proceed, please install ngrok CLI using https://dashboard.ngrok.com/get-started/setup"
-    assert any(
-        (models.env.distribution_id, models.env.distribution_config)
-    ), "\n\tAny one of 'distribution_id' or 'distribution_config' is required"
-    if models.env.distribution_config:
-        assert models.env.distribution_config.suffix.lower() in (
-            ".yml",
-            ".yaml",
-            ".json",
-        ), "\n\tConfig file can only be JSON or YAML"
-    if models.env.ngrok_config:
-        LOGGER.info("Using ngrok config file: %s", models.env.ngrok_config)
-    elif models.env.ngrok_auth:
+    for tunnel in env.mappings():
+        assert any(
+            (tunnel.distribution_id, tunnel.distribution_config)
+        ), f"\n\tAny one of 'distribution_id' or 'distribution_config' is required for {tunnel.name!r}"
+        if tunnel.distribution_config:
+            assert tunnel.distribution_config.suffix.lower() in (
+                ".yml",
+                ".yaml",
+                ".json",
+            ), "\n\tConfig file can only be JSON or YAML"
+    if env.tunnels:
+        # ngrok skips the default config location when --config is used, so the auth config has to be explicit
+        assert any(
+            (env.ngrok_config, env.ngrok_auth)
+        ), "\n\tAny one of 'ngrok_config' or 'ngrok_auth' is required for multiple tunnels"
+    if env.ngrok_config:
+        LOGGER.info("Using ngrok config file: %s", env.ngrok_config)
+    elif env.ngrok_auth:
         config_file = "ngrok.yml"
         LOGGER.info("Creating ngrok config file as %s", config_file)
-        create_ngrok_config(models.env.ngrok_auth, config_file)
-        models.env.ngrok_config = config_file
+        create_ngrok_config(env.ngrok_auth, config_file)
+        return env.replace(ngrok_config=pathlib.Path(config_file))
+    return env
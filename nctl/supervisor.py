@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Sequence
+
+from nctl import logfmt
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+Handler = Callable[[logfmt.Frame], None]
+
+
+class Supervisor:
+    """Runs a subprocess with asyncio, draining both stdout and stderr concurrently.
+
+    >>> Supervisor
+
+    See Also:
+        - Each stream is fed into its own ``logfmt.Tokenizer``, so the pipes never fill up.
+        - Parsed frames are queued and dispatched to the handlers on a dedicated thread, in order, in batches of
+          whatever is queued, so the executor round trip is paid once per batch instead of once per line.
+        - Handlers can block without stalling the readers, until the queue is full. Then the readers wait, so that
+          the pipes fill up and ngrok is slowed down, instead of buffering every line in memory.
+    """
+
+    def __init__(
+        self,
+        command: Sequence[str],
+        handlers: List[Handler],
+        timeout: float = 3,
+        lazy: bool = False,
+        batch_size: int = 1024,
+        max_queued: int = 16384,
+    ):
+        """Instantiates the supervisor.
+
+        Args:
+            command: Executable and its arguments, invoked without a shell.
+            handlers: Callables that receive every parsed frame.
+            timeout: Seconds to wait for the process to terminate gracefully, before killing it.
+            lazy: Boolean flag to only read the level of each line, and parse the rest when the frame is used.
+            batch_size: Maximum number of frames handed to the dispatcher thread at once.
+            max_queued: Maximum number of frames waiting for the dispatcher, before the readers wait.
+        """
+        self.command = list(command)
+        self.handlers = handlers
+        self.timeout = timeout
+        self.lazy = lazy
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self.process: asyncio.subprocess.Process | None = None
+        self._stopping: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def _read(
+        self, stream: asyncio.StreamReader, queue: asyncio.Queue, stderr: bool
+    ) -> None:
+        """Reads raw chunks from a stream and queues every parsed frame.
+
+        Args:
+            stream: Stream reader for stdout or stderr.
+            queue: Queue shared with the dispatcher.
+            stderr: Flag to indicate that the stream is stderr.
+        """
+        tokenizer = logfmt.Tokenizer(lazy=self.lazy)
+        while chunk := await stream.read(65536):
+            for frame in tokenizer.feed(chunk):
+                await self._put(queue, self._normalize(frame, stderr))
+        for frame in tokenizer.flush():
+            await self._put(queue, self._normalize(frame, stderr))
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, frame: logfmt.Frame) -> None:
+        """Queues the frame, and waits for a free slot only when the queue is full."""
+        try:
+            # skips creating a coroutine for every frame, while the dispatcher keeps up
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            await queue.put(frame)
+
+    @staticmethod
+    def _normalize(frame: logfmt.Frame, stderr: bool) -> logfmt.Frame:
+        """Surfaces plain-text lines from stderr as errors, since they are not logfmt."""
+        if stderr and frame.lvl is None:
+            return frame._replace(
+                lvl="error", msg=frame.raw.decode(errors="replace"), extra={}
+            )
+        return frame
+
+    def _handle(self, frames: List[logfmt.Frame]) -> None:
+        """Runs every handler on a batch of frames, in order, on the dispatcher thread.
+
+        Args:
+            frames: Batch of frames drained from the queue.
+        """
+        for frame in frames:
+            for handler in self.handlers:
+                try:
+                    handler(frame)
+                except Exception as error:
+                    LOGGER.exception("Handler %s failed: %s", handler.__name__, error)
+
+    async def _dispatch(self, queue: asyncio.Queue) -> None:
+        """Dispatches the queued frames to the handlers on a single worker thread.
+
+        Args:
+            queue: Queue shared with the readers.
+        """
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dispatcher"
+        ) as executor:
+            while True:
+                # waits for the first frame, then drains whatever else is queued without waiting
+                batch = [await queue.get()]
+                while len(batch) < self.batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+                # the sentinel is queued last, once both readers are done
+                if done := batch[-1] is None:
+                    batch.pop()
+                if batch:
+                    await loop.run_in_executor(executor, self._handle, batch)
+                if done:
+                    return
+
+    @property
+    def stopped(self) -> bool:
+        """Indicates whether a shutdown was requested, as opposed to the process exiting on its own."""
+        return bool(self._stopping and self._stopping.is_set())
+
+    def stop(self) -> None:
+        """Requests a graceful shutdown."""
+        if self._stopping and not self._stopping.is_set():
+            LOGGER.warning("Tunneling interrupted")
+            self._stopping.set()
+
+    def request_stop(self) -> None:
+        """Stops the process from any thread, without logging it as an interruption."""
+        if self._loop and self._stopping:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _terminate(self) -> None:
+        """Terminates the process gracefully, and kills it if it doesn't exit within the timeout."""
+        if self.process.returncode is not None:
+            return
+        try:
+            self.process.terminate()
+        except ProcessLookupError:
+            # process exited, but hasn't been reaped yet
+            await self.process.wait()
+            return
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    async def run(self) -> int:
+        """Starts the process and supervises it until it exits or a shutdown is requested.
+
+        Returns:
+            int:
+            Return code of the process.
+        """
+        loop = self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows event loops and non-main threads don't support signal handlers
+                pass
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        readers = asyncio.gather(
+            self._read(self.process.stdout, queue, stderr=False),
+            self._read(self.process.stderr, queue, stderr=True),
+        )
+        dispatcher = asyncio.create_task(self._dispatch(queue))
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            await asyncio.wait((readers, stopping), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping.cancel()
+            await self._terminate()
+            # terminating the process closes the pipes, so the readers drain what's left and return
+            await readers
+            await queue.put(None)
+            await dispatcher
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass
+        return self.process.returncode
+
+
+class RestartPolicy:
+    """Exponential backoff between restarts, with a circuit breaker for crash loops.
+
+    >>> RestartPolicy
+
+    See Also:
+        - The delay doubles with every consecutive crash, and resets once the process stays up past ``window``
+        - The breaker trips when ``max_failures`` crashes happen within ``window`` seconds.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float = 1,
+        max_delay: float = 60,
+        factor: float = 2,
+        max_failures: int = 5,
+        window: float = 60,
+    ):
+        """Instantiates the policy.
+
+        Args:
+            initial_delay: Delay before the first restart.
+            max_delay: Maximum delay between restarts.
+            factor: Multiplier applied to the delay after each consecutive crash.
+            max_failures: Number of crashes within the window that trips the breaker.
+            window: Sliding window in seconds, also the uptime after which the process is considered healthy.
+        """
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.max_failures = max_failures
+        self.window = window
+        self.delay = initial_delay
+        self.failures: Deque[float] = deque()
+
+    def next_delay(self, uptime: float) -> float | None:
+        """Records a crash and returns the delay before the next restart.
+
+        Args:
+            uptime: Seconds the process ran before exiting.
+
+        Returns:
+            float:
+            Delay in seconds, or ``None`` when the breaker has tripped.
+        """
+        now = time.monotonic()
+        if uptime >= self.window:
+            self.delay = self.initial_delay
+        self.failures.append(now)
+        while self.failures and now - self.failures[0] > self.window:
+            self.failures.popleft()
+        if len(self.failures) >= self.max_failures:
+            return None
+        delay, self.delay = self.delay, min(self.delay * self.factor, self.max_delay)
+        return delay
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket to rate limit API calls.
+
+    >>> TokenBucket
+
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """Instantiates a full bucket.
+
+        Args:
+            rate: Number of tokens added per second.
+            capacity: Maximum number of tokens, defaults to the rate (one second worth of burst), but at least one.
+        """
+        self.rate = rate
+        # a capacity below one token would never fit a single call, so acquire would block forever
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Takes tokens from the bucket, blocking until they are available.
+
+        Args:
+            tokens: Number of tokens to take.
+
+        Returns:
+            float:
+            Time spent waiting for the tokens.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                shortfall = (tokens - self._tokens) / self.rate
+            time.sleep(shortfall)
+            waited += shortfall
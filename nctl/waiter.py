@@ -0,0 +1,120 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, NamedTuple
+
+LOGGER = logging.getLogger("nctl.cloudfront")
+
+
+class DeployProgress(NamedTuple):
+    """Progress event emitted after every status check.
+
+    >>> DeployProgress
+
+    """
+
+    attempt: int
+    status: str
+    elapsed: float
+    delay: float
+
+
+class DeployWaiter:
+    """Polls the distribution status with exponential backoff and jitter, on a background thread.
+
+    >>> DeployWaiter
+
+    See Also:
+        - Short initial intervals detect fast deployments early, while the backoff keeps the API calls low.
+        - The returned future resolves with the last ``get_distribution`` response once the status is ``Deployed``
+        - The future is cancelled when the cancel event is set, and fails with ``TimeoutError`` past the deadline.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        distribution_id: str,
+        initial_delay: float = 5,
+        max_delay: float = 60,
+        factor: float = 2,
+        deadline: float = 900,
+        on_progress: Callable[[DeployProgress], None] | None = None,
+        cancel: threading.Event | None = None,
+    ):
+        """Instantiates the waiter.
+
+        Args:
+            client: CloudFront client.
+            distribution_id: Distribution ID.
+            initial_delay: Initial delay between status checks.
+            max_delay: Maximum delay between status checks.
+            factor: Multiplier applied to the delay after each status check.
+            deadline: Maximum time to wait for the deployment.
+            on_progress: Callback for progress events.
+            cancel: Event to stop waiting.
+        """
+        self.client = client
+        self.distribution_id = distribution_id
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.deadline = deadline
+        self.on_progress = on_progress or self._log_progress
+        self.cancel = cancel or threading.Event()
+        self.future: Future = Future()
+
+    @staticmethod
+    def _log_progress(progress: DeployProgress) -> None:
+        """Default progress callback."""
+        LOGGER.info(
+            "Deployment status: %s [attempt: %d, elapsed: %.1fs]",
+            progress.status,
+            progress.attempt,
+            progress.elapsed,
+        )
+
+    def _poll(self) -> None:
+        """Polls the distribution status until it is deployed, cancelled or past the deadline."""
+        start = time.monotonic()
+        delay = self.initial_delay
+        attempt = 0
+        while not (self.cancel.is_set() or self.future.cancelled()):
+            attempt += 1
+            try:
+                response = self.client.get_distribution(Id=self.distribution_id)
+                status = response["Distribution"]["Status"]
+            except Exception as error:
+                # transient failures shouldn't abort the wait, the deadline caps the retries anyway
+                LOGGER.warning("Failed to get deployment status: %s", error)
+                response, status = None, "Unknown"
+            elapsed = time.monotonic() - start
+            # equal jitter, so that multiple waiters don't poll in lockstep
+            sleep = max(min(delay, self.deadline - elapsed), 0) * random.uniform(0.5, 1)
+            self.on_progress(DeployProgress(attempt, status, elapsed, sleep))
+            if self.future.cancelled():
+                return
+            if status == "Deployed":
+                self.future.set_result(response)
+                return
+            if elapsed >= self.deadline:
+                self.future.set_exception(
+                    TimeoutError(
+                        f"Distribution {self.distribution_id!r} was not deployed within {self.deadline}s"
+                    )
+                )
+                return
+            self.cancel.wait(sleep)
+            delay = min(delay * self.factor, self.max_delay)
+        self.future.cancel()
+
+    def start(self) -> Future:
+        """Starts polling on a daemon thread.
+
+        Returns:
+            Future:
+            Future that resolves with the response once the distribution is deployed.
+        """
+        threading.Thread(target=self._poll, name="deploy-waiter", daemon=True).start()
+        return self.future
@@ -0,0 +1,213 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+# https://man7.org/linux/man-pages/man7/inotify.7.html
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct("iIII")
+
+
+def _digest(filepath: str) -> str | None:
+    """Hashes the content of a file, ``None`` when it doesn't exist."""
+    try:
+        with open(filepath, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return
+
+
+def _stat(filepath: str) -> Tuple[int, int, int] | None:
+    """Returns the inode, size and modification time of a file, ``None`` when it doesn't exist."""
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class FileWatcher(threading.Thread):
+    """Watches a set of files and reports the ones whose content has changed.
+
+    >>> FileWatcher
+
+    See Also:
+        - Uses inotify on Linux, and falls back to polling ``os.stat`` elsewhere, or when inotify is unavailable.
+        - Parent directories are watched, so that editors replacing the file with a rename are detected as well.
+        - Changes are confirmed by the content hash, so touching or rewriting a file with the same content is ignored.
+        - Bursts of events are coalesced for the interval, before the callback is invoked once.
+    """
+
+    def __init__(
+        self,
+        paths: Iterable[str | os.PathLike],
+        callback: Callable[[List[str]], None],
+        interval: float = 1,
+    ):
+        """Instantiates the watcher thread.
+
+        Args:
+            paths: Files to watch.
+            callback: Callable that receives the list of changed files.
+            interval: Polling interval, and the quiet period to coalesce bursts of events.
+        """
+        super().__init__(name="file-watcher", daemon=True)
+        self.callback = callback
+        self.interval = interval
+        self.digests: Dict[str, str | None] = {}
+        self.stats: Dict[str, Tuple[int, int, int] | None] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._fd: int | None = None
+        self._watches: Dict[int, str] = {}
+        self._libc = None
+        self.watch(paths)
+
+    def watch(self, paths: Iterable[str | os.PathLike]) -> None:
+        """Replaces the set of watched files, keeping the known state of the ones that are still watched.
+
+        Args:
+            paths: Files to watch.
+        """
+        paths = {os.path.abspath(path) for path in paths if path}
+        with self._lock:
+            self.digests = {
+                path: self.digests[path] if path in self.digests else _digest(path)
+                for path in paths
+            }
+            self.stats = {path: _stat(path) for path in paths}
+        if self._fd is not None:
+            self._add_watches()
+
+    def _init_inotify(self) -> bool:
+        """Initializes inotify, if available."""
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as error:
+            LOGGER.debug("inotify is unavailable: %s", error)
+            return False
+        if fd < 0:
+            LOGGER.debug("inotify is unavailable: %s", os.strerror(ctypes.get_errno()))
+            return False
+        self._fd = fd
+        self._add_watches()
+        return True
+
+    def _add_watches(self) -> None:
+        """Adds a watch for the parent directory of every watched file."""
+        with self._lock:
+            directories = {os.path.dirname(path) for path in self.digests}
+        for directory in directories - set(self._watches.values()):
+            wd = self._libc.inotify_add_watch(
+                self._fd,
+                directory.encode(),
+                IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE,
+            )
+            if wd < 0:
+                LOGGER.warning(
+                    "Unable to watch %s: %s",
+                    directory,
+                    os.strerror(ctypes.get_errno()),
+                )
+                continue
+            self._watches[wd] = directory
+
+    def _events(self) -> bool:
+        """Reads the pending inotify events.
+
+        Returns:
+            bool:
+            Flag to indicate whether any of the events were for a watched file.
+        """
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return False
+        relevant, offset = False, 0
+        while offset < len(data):
+            wd, _, _, length = EVENT.unpack_from(data, offset)
+            start = offset + EVENT.size
+            offset = start + length
+            name = data[start:offset].rstrip(b"\0")
+            if directory := self._watches.get(wd):
+                relevant |= os.path.join(directory, name.decode()) in self.digests
+        return relevant
+
+    def _wait(self) -> bool:
+        """Blocks until a watched file might have changed, or for one interval when stopped.
+
+        Returns:
+            bool:
+            Flag to indicate whether the watched files have to be checked.
+        """
+        if self._fd is None:
+            self._stopping.wait(self.interval)
+            with self._lock:
+                return any(_stat(path) != stat for path, stat in self.stats.items())
+        readable, _, _ = select.select([self._fd], [], [], self.interval)
+        if not (readable and self._events()):
+            return False
+        # coalesce the burst of events from a single save, eg: truncate, write and close
+        while select.select([self._fd], [], [], self.interval)[0]:
+            self._events()
+        return True
+
+    def _changes(self) -> List[str]:
+        """Compares the content hashes of the watched files, and records the new state.
+
+        Returns:
+            List[str]:
+            List of files whose content has changed.
+        """
+        changed = []
+        with self._lock:
+            for path, digest in self.digests.items():
+                self.stats[path] = _stat(path)
+                if (current := _digest(path)) != digest:
+                    self.digests[path] = current
+                    changed.append(path)
+        return changed
+
+    def run(self) -> None:
+        """Watches the files until stopped."""
+        backend = "inotify" if self._init_inotify() else "stat polling"
+        LOGGER.debug("Watching %d files with %s", len(self.digests), backend)
+        try:
+            while not self._stopping.is_set():
+                if not self._wait() or not (changed := self._changes()):
+                    continue
+                LOGGER.info("Detected changes in %s", ", ".join(changed))
+                try:
+                    self.callback(changed)
+                except Exception as error:
+                    LOGGER.exception("Failed to apply the changes: %s", error)
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def stop(self, timeout: float = 3) -> None:
+        """Stops watching, and waits for the thread to exit.
+
+        Args:
+            timeout: Maximum time to wait for the thread to exit.
+        """
+        self._stopping.set()
+        self.join(timeout=timeout)
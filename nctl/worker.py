@@ -0,0 +1,272 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, List, Tuple
+
+from pydantic import BaseModel
+
+from nctl import aws, health, metrics, models
+
+LOGGER = logging.getLogger("nctl.tunnel")
+
+
+class JobMetrics(BaseModel):
+    """BaseModel object for the latency metrics of each distribution update.
+
+    >>> JobMetrics
+
+    """
+
+    public_url: str
+    queued: float
+    wait: float
+    duration: float
+    coalesced: int = 0
+    cancelled: bool = False
+    deployed: float | None = None
+    error: str | None = None
+
+
+class Worker(threading.Thread):
+    """Long-lived worker that keeps a warm CloudFront client and processes distribution updates.
+
+    >>> Worker
+
+    See Also:
+        - Only the latest public URL is retained, so a burst of URL changes results in a single update.
+        - A job starts only after no new URL has been submitted for the debounce interval.
+        - Submitting a new URL cancels the in-flight update at its next checkpoint.
+    """
+
+    def __init__(
+        self,
+        tunnel: models.Tunnel,
+        semaphore: threading.Semaphore | None = None,
+        debounce: float = 0,
+        history: int = 100,
+    ):
+        """Instantiates the worker thread.
+
+        Args:
+            tunnel: Tunnel to distribution mapping.
+            semaphore: Semaphore shared across workers, to limit the number of parallel updates.
+            debounce: Seconds to wait for the public URL to settle before updating the distribution.
+            history: Number of job metrics to retain.
+        """
+        super().__init__(name=f"distribution-handler-{tunnel.name}", daemon=True)
+        self.tunnel = tunnel
+        self.semaphore = semaphore or threading.BoundedSemaphore()
+        self.debounce = debounce
+        self.metrics: Deque[JobMetrics] = deque(maxlen=history)
+        self.ready = threading.Event()
+        self.cloudfront: aws.CloudFront | None = None
+        self._condition = threading.Condition()
+        self._pending: Tuple[str, float] | None = None
+        self._coalesced = 0
+        self._submitted = 0.0
+        self._cancel = threading.Event()
+        self._stopped = False
+        self._probe: health.Probe | None = None
+
+    def submit(self, public_url: str) -> None:
+        """Replaces any pending update with the public URL, and cancels the in-flight update.
+
+        Args:
+            public_url: Public URL from ngrok, that has to be updated.
+        """
+        with self._condition:
+            self._submitted = time.monotonic()
+            if self._pending:
+                LOGGER.info("Superseding pending update for %s", self._pending[0])
+                self._coalesced += 1
+                self._pending = (public_url, self._pending[1])
+            else:
+                self._pending = (public_url, self._submitted)
+            self._cancel.set()
+            self._condition.notify()
+
+    def _next(self) -> Tuple[str, float, int] | None:
+        """Waits for a pending URL that has settled for the debounce interval.
+
+        Returns:
+            Tuple[str, float, int]:
+            Public URL, time it was first queued and the number of coalesced URLs. ``None`` when stopped.
+        """
+        with self._condition:
+            while not self._stopped:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                settled = self._submitted + self.debounce - time.monotonic()
+                if settled > 0:
+                    self._condition.wait(settled)
+                    continue
+                (public_url, queued), coalesced = self._pending, self._coalesced
+                self._pending, self._coalesced = None, 0
+                # a fresh token, so that only submissions from here on cancel this job
+                self._cancel = threading.Event()
+                return public_url, queued, coalesced
+
+    def reset_probe(self) -> None:
+        """Closes the pooled probe of the local origin, so that the next job probes the current host and port."""
+        if probe := self._probe:
+            self._probe = None
+            probe.close()
+
+    def _healthy(self, public_url: str, cancel: threading.Event) -> bool:
+        """Waits for the local origin, and optionally the public URL, to pass the health checks.
+
+        Args:
+            public_url: Public URL from ngrok.
+            cancel: Event that is set when the job is superseded.
+
+        Returns:
+            bool:
+            Flag to indicate whether the update should proceed.
+        """
+        if not self._probe:
+            # the connection to the local origin is pooled across jobs, until the mapping's host or port changes
+            self._probe = health.Probe(
+                base_url=f"http://{self.tunnel.host}:{self.tunnel.port}",
+                path=models.env.health_path,
+                expected_status=models.env.health_status,
+                timeout=models.env.health_probe_timeout,
+                name=f"local-{self.tunnel.name}",
+            )
+        probes = [self._probe]
+        if models.env.health_public:
+            probes.append(
+                health.Probe(
+                    base_url=public_url,
+                    path=models.env.health_path,
+                    expected_status=models.env.health_status,
+                    timeout=models.env.health_probe_timeout,
+                    name=f"public-{self.tunnel.name}",
+                )
+            )
+        start = time.monotonic()
+        try:
+            healthy = health.wait_healthy(
+                probes=probes,
+                successes=models.env.health_successes,
+                interval=models.env.health_interval,
+                timeout=models.env.health_timeout,
+                cancel=cancel,
+            )
+        finally:
+            for probe in probes[1:]:
+                probe.close()
+        if cancel.is_set():
+            LOGGER.info("Health check for %s has been superseded", public_url)
+            return False
+        if healthy:
+            LOGGER.info(
+                "Origin is healthy [%d checks in %.1fs]",
+                models.env.health_successes,
+                time.monotonic() - start,
+            )
+        else:
+            # the previous public URL is gone anyway, so pointing CloudFront to the new one can only help
+            LOGGER.warning(
+                "Origin is not healthy after %ss, updating the distribution anyway",
+                models.env.health_timeout,
+            )
+        return True
+
+    def run(self) -> None:
+        """Warms up the CloudFront client once, and processes the pending URLs until stopped."""
+        start = time.perf_counter()
+        try:
+            self.cloudfront = aws.CloudFront(
+                tunnel=self.tunnel, client=aws.shared_client()
+            )
+        except Exception as error:
+            LOGGER.exception("Failed to instantiate CloudFront client: %s", error)
+            return
+        LOGGER.debug(
+            "CloudFront client warmed up in %.3fs", time.perf_counter() - start
+        )
+        self.ready.set()
+        while job := self._next():
+            public_url, queued, coalesced = job
+            cancel = self._cancel
+            error = None
+            if models.env.health_check and not self._healthy(public_url, cancel):
+                continue
+            with self.semaphore:
+                started = time.monotonic()
+                try:
+                    self.cloudfront.run(public_url, cancel)
+                except Exception as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                    LOGGER.exception("Failed to update distribution for %s", public_url)
+            job_metrics = JobMetrics(
+                public_url=public_url,
+                queued=queued,
+                wait=started - queued,
+                duration=time.monotonic() - started,
+                coalesced=coalesced,
+                cancelled=cancel.is_set(),
+                error=error,
+            )
+            self.metrics.append(job_metrics)
+            LOGGER.debug("Job metrics: %s", job_metrics)
+            metrics.JOB_WAIT_SECONDS.observe(job_metrics.wait, tunnel=self.tunnel.name)
+            metrics.JOB_SECONDS.observe(job_metrics.duration, tunnel=self.tunnel.name)
+            if coalesced:
+                metrics.JOB_COALESCED.inc(coalesced, tunnel=self.tunnel.name)
+            # the deployment is awaited in the background, so the next URL change can be picked up right away
+            if deployment := self.cloudfront.deployment:
+                deployment.add_done_callback(
+                    functools.partial(
+                        self._ready, self.tunnel.name, job_metrics, started
+                    )
+                )
+        if self._probe:
+            self._probe.close()
+
+    @staticmethod
+    def _ready(
+        tunnel: str, job_metrics: JobMetrics, started: float, future: Future
+    ) -> None:
+        """Records the deployment latency and reports readiness once CloudFront has deployed the update.
+
+        Args:
+            tunnel: Name of the tunnel, used to label the deployment latency.
+            job_metrics: Metrics of the job that triggered the deployment.
+            started: Time when the job was started.
+            future: Completed deployment future.
+        """
+        if future.cancelled() or future.exception():
+            return
+        job_metrics.deployed = time.monotonic() - started
+        metrics.JOB_DEPLOYED_SECONDS.observe(job_metrics.deployed, tunnel=tunnel)
+        LOGGER.info(
+            "CloudFront is serving %s [deployed in %.1fs]",
+            job_metrics.public_url,
+            job_metrics.deployed,
+        )
+
+    def history(self) -> List[JobMetrics]:
+        """Returns the latency metrics of the most recent jobs.
+
+        Returns:
+            List[JobMetrics]:
+            List of job metrics, oldest first.
+        """
+        return list(self.metrics)
+
+    def stop(self, timeout: float = 3) -> None:
+        """Cancels the in-flight update, discards the pending one, and waits for the worker to exit.
+
+        Args:
+            timeout: Maximum time to wait for the worker to exit.
+        """
+        with self._condition:
+            self._stopped = True
+            self._cancel.set()
+            self._condition.notify()
+        self.join(timeout=timeout)
@@ -0,0 +1,283 @@
+import http.server
+import json
+import socket
+import threading
+import time
+import unittest
+from typing import List
+
+from nctl import agent
+
+
+class AgentAPI(http.server.ThreadingHTTPServer):
+    """Stand-in for ngrok's local agent API, serving a mutable list of tunnels.
+
+    >>> AgentAPI
+
+    """
+
+    def __init__(self, port: int = 0):
+        """Binds to a local port, and counts the requests for the tunnels.
+
+        Args:
+            port: Port to bind, ``0`` picks a free port.
+        """
+        super().__init__(("127.0.0.1", port), AgentHandler)
+        self.tunnels: List[dict] = []
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        """Base URL of the API."""
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def __enter__(self) -> "AgentAPI":
+        """Serves the API on a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+class AgentHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler for ``/api/tunnels``, with keep-alive connections like the agent API.
+
+    >>> AgentHandler
+
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Responds with the current tunnels."""
+        self.server.requests += 1
+        if self.path != "/api/tunnels":
+            self.send_error(404)
+            return
+        body = json.dumps({"tunnels": self.server.tunnels}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_) -> None:
+        """Keeps the test output clean."""
+
+
+def free_port() -> int:
+    """Returns a port that nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def tunnel(name: str, public_url: str) -> dict:
+    """Tunnel object in the shape returned by the agent API."""
+    return {"name": name, "proto": public_url.split(":")[0], "public_url": public_url}
+
+
+class TestAgentClient(unittest.TestCase):
+    """Tests for ``AgentClient`` against a local stand-in for the agent API.
+
+    >>> TestAgentClient
+
+    """
+
+    def test_public_url(self) -> None:
+        """The HTTPS URL is returned over a single keep-alive connection."""
+        with AgentAPI() as api:
+            api.tunnels = [
+                tunnel("command_line", "http://abc.ngrok-free.app"),
+                tunnel("command_line", "https://abc.ngrok-free.app"),
+            ]
+            client = agent.AgentClient(api.url)
+            try:
+                self.assertEqual(client.public_url(), "https://abc.ngrok-free.app")
+                connection = client._connection
+                self.assertEqual(client.public_url(), "https://abc.ngrok-free.app")
+                self.assertIs(client._connection, connection)
+            finally:
+                client.close()
+            self.assertEqual(api.requests, 2)
+
+    def test_name_filter(self) -> None:
+        """Only the tunnel with the matching name is considered."""
+        with AgentAPI() as api:
+            api.tunnels = [
+                tunnel("web", "https://web.ngrok-free.app"),
+                tunnel("api", "https://api.ngrok-free.app"),
+            ]
+            client = agent.AgentClient(api.url)
+            try:
+                self.assertEqual(client.public_url("api"), "https://api.ngrok-free.app")
+                self.assertEqual(client.public_url("web"), "https://web.ngrok-free.app")
+                self.assertIsNone(client.public_url("missing"))
+            finally:
+                client.close()
+
+    def test_not_listening(self) -> None:
+        """Connection errors are raised, and the broken connection is discarded."""
+        client = agent.AgentClient(f"http://127.0.0.1:{free_port()}")
+        with self.assertRaises(OSError):
+            client.public_url()
+        self.assertIsNone(client._connection)
+
+
+class TestDiscover(unittest.TestCase):
+    """Tests for ``discover`` against a local stand-in for the agent API.
+
+    >>> TestDiscover
+
+    """
+
+    def test_found(self) -> None:
+        """The public URL is returned as soon as the tunnel is up."""
+        with AgentAPI() as api:
+            api.tunnels = [tunnel("command_line", "https://abc.ngrok-free.app")]
+            client = agent.AgentClient(api.url)
+            try:
+                public_url = agent.discover(
+                    client, interval=0.01, max_interval=0.1, factor=2, timeout=5
+                )
+            finally:
+                client.close()
+        self.assertEqual(public_url, "https://abc.ngrok-free.app")
+        self.assertEqual(api.requests, 1)
+
+    def test_found_after_tunnel_starts(self) -> None:
+        """Polling continues while the agent is up, but the tunnel isn't yet."""
+        with AgentAPI() as api:
+            threading.Timer(
+                0.2,
+                lambda: api.tunnels.append(tunnel("web", "https://web.ngrok-free.app")),
+            ).start()
+            client = agent.AgentClient(api.url)
+            try:
+                public_url = agent.discover(
+                    client,
+                    interval=0.01,
+                    max_interval=0.05,
+                    factor=2,
+                    timeout=5,
+                    name="web",
+                )
+            finally:
+                client.close()
+        self.assertEqual(public_url, "https://web.ngrok-free.app")
+        self.assertGreater(api.requests, 1)
+
+    def test_agent_not_listening_yet(self) -> None:
+        """Connection errors are retried with backoff, until the agent starts listening."""
+        port = free_port()
+        servers = []
+
+        def listen() -> None:
+            api = AgentAPI(port)
+            api.tunnels = [tunnel("command_line", "https://abc.ngrok-free.app")]
+            servers.append(api.__enter__())
+
+        threading.Timer(0.5, listen).start()
+        client = agent.AgentClient(f"http://127.0.0.1:{port}")
+        start = time.monotonic()
+        try:
+            public_url = agent.discover(
+                client, interval=0.01, max_interval=0.2, factor=2, timeout=5
+            )
+        finally:
+            client.close()
+            for server in servers:
+                server.__exit__()
+        self.assertEqual(public_url, "https://abc.ngrok-free.app")
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+        # polls at 0.01, 0.02, 0.04, 0.08, 0.16 and then 0.2, so the agent is found within one max interval
+        self.assertLess(time.monotonic() - start, 0.5 + 0.2 + 0.5)
+
+    def test_backoff(self) -> None:
+        """The interval between polls grows by the factor, up to the max interval."""
+        client = agent.AgentClient(f"http://127.0.0.1:{free_port()}")
+        waits = []
+        stop = threading.Event()
+        original = stop.wait
+
+        def wait(timeout: float) -> bool:
+            waits.append(round(timeout, 3))
+            if len(waits) == 6:
+                stop.set()
+            return original(0)
+
+        stop.wait = wait
+        public_url = agent.discover(
+            client, interval=0.01, max_interval=0.08, factor=2, timeout=5, stop=stop
+        )
+        self.assertIsNone(public_url)
+        self.assertEqual(waits, [0.01, 0.02, 0.04, 0.08, 0.08, 0.08])
+
+    def test_timeout(self) -> None:
+        """``None`` is returned once the timeout elapses without a public URL."""
+        with AgentAPI() as api:
+            client = agent.AgentClient(api.url)
+            start = time.monotonic()
+            try:
+                with self.assertLogs("nctl.tunnel", level="ERROR"):
+                    public_url = agent.discover(
+                        client, interval=0.01, max_interval=0.05, factor=2, timeout=0.3
+                    )
+            finally:
+                client.close()
+        self.assertIsNone(public_url)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_stop(self) -> None:
+        """Polling is aborted when the stop event is set."""
+        stop = threading.Event()
+        threading.Timer(0.1, stop.set).start()
+        client = agent.AgentClient(f"http://127.0.0.1:{free_port()}")
+        start = time.monotonic()
+        public_url = agent.discover(
+            client, interval=0.01, max_interval=0.05, factor=2, timeout=5, stop=stop
+        )
+        self.assertIsNone(public_url)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class TestWatch(unittest.TestCase):
+    """Tests for ``watch`` against a local stand-in for the agent API.
+
+    >>> TestWatch
+
+    """
+
+    def test_rotation(self) -> None:
+        """Only a changed public URL is yielded, and polling stops with the event."""
+        with AgentAPI() as api:
+            api.tunnels = [tunnel("command_line", "https://abc.ngrok-free.app")]
+            threading.Timer(
+                0.2,
+                lambda: api.tunnels.insert(
+                    0, tunnel("command_line", "https://xyz.ngrok-free.app")
+                ),
+            ).start()
+            stop = threading.Event()
+            threading.Timer(0.5, stop.set).start()
+            client = agent.AgentClient(api.url)
+            try:
+                public_urls = list(
+                    agent.watch(
+                        client,
+                        public_url="https://abc.ngrok-free.app",
+                        interval=0.02,
+                        stop=stop,
+                    )
+                )
+            finally:
+                client.close()
+        self.assertEqual(public_urls, ["https://xyz.ngrok-free.app"])
+
+
+if __name__ == "__main__":
+    unittest.main()